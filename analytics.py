@@ -0,0 +1,126 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from evaluation import KIND_COLUMNS, RESULT_COLUMNS
+
+PERCENTILES = [0.25, 0.5, 0.75, 0.9]
+SCORE_BINS = np.arange(0, 12)  # Integer score buckets 0, 1, ..., 10 (the last bin includes 10)
+
+
+def numeric_scores(scores: pd.Series) -> pd.Series:
+    """
+    Scores as float64, with errors and qualitative scores as NaN.
+    """
+    return pd.to_numeric(scores.astype(object), errors="coerce").astype("float64")
+
+
+def _scores(grades: pd.DataFrame) -> pd.Series:
+    # CompactResults.grades carries the numeric scores alongside the grader's own Score
+    return grades["Numeric Score"] if "Numeric Score" in grades else numeric_scores(grades["Score"])
+
+
+class CompactResults:
+    """
+    Result rows stored column-wise: the input text of every row is kept once per Index in
+    inputs, and one row per (Index, Metric) in grades with categorical Metric and Score (as the
+    grader gave it, numeric or qualitative) and a float Numeric Score for the analytics, instead of
+    repeating the Question/Context/Answer text in every metric's result.
+
+    Adding results for an (Index, Metric) pair that is already stored replaces it, keeping the
+    position where the pair first appeared.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.input_columns = KIND_COLUMNS[kind][1:]
+        self.grade_columns = [col for col in RESULT_COLUMNS[kind] if col not in self.input_columns]
+        self.inputs = pd.DataFrame(columns=self.input_columns, index=pd.Index([], name="Key"))
+        self.grades = pd.DataFrame(columns=[*self.grade_columns, "Numeric Score"])
+
+    @classmethod
+    def from_results(cls, results: list, kind: str) -> "CompactResults":
+        store = cls(kind)
+        store.add(results)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.grades)
+
+    def add(self, results) -> None:
+        """
+        Add result rows, given as a list of dicts or a DataFrame in the RESULT_COLUMNS layout.
+        """
+        frame = pd.DataFrame(results)
+        if frame.empty:
+            return
+        frame = frame.reindex(columns=RESULT_COLUMNS[self.kind])
+        keys = frame["Index"].astype(str)
+
+        inputs = frame[self.input_columns].set_axis(pd.Index(keys, name="Key"))
+        inputs = pd.concat([self.inputs, inputs])
+        self.inputs = inputs[~inputs.index.duplicated(keep="last")]
+
+        grades = frame[self.grade_columns].assign(**{"Numeric Score": numeric_scores(frame["Score"])})
+        grades = pd.concat([self.grades, grades], ignore_index=True) if len(self.grades) else grades
+        pair = pd.DataFrame({"Key": grades["Index"].astype(str), "Metric": grades["Metric"].astype(str)})
+        first_seen = pair.groupby(["Key", "Metric"], sort=False).ngroup()
+        latest = ~pair.duplicated(keep="last")
+        grades = grades[latest].iloc[np.argsort(first_seen[latest].to_numpy(), kind="stable")]
+        self.grades = grades.reset_index(drop=True).astype({
+            "Metric": "category", "Selected Columns": "category", "Score": "category", "Numeric Score": "float64"
+        })
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The full result rows (input text joined back in), in RESULT_COLUMNS order.
+        """
+        joined = self.grades.join(self.inputs, on=self.grades["Index"].astype(str))
+        return joined.reindex(columns=RESULT_COLUMNS[self.kind]).reset_index(drop=True)
+
+
+def score_summary(grades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-metric count, mean, standard deviation, min/max and percentiles of the numeric scores,
+    plus the number of results without a numeric score.
+    """
+    scores = _scores(grades)
+    metrics = grades["Metric"].astype(str)
+    grouped = scores.groupby(metrics, sort=False)
+    summary = grouped.agg(["count", "mean", "std", "min", "max"])
+    quantiles = grouped.quantile(PERCENTILES).unstack()
+    quantiles.columns = [f"p{int(q * 100)}" for q in quantiles.columns]
+    summary = summary.join(quantiles)
+    summary["unscored"] = scores.isna().groupby(metrics, sort=False).sum()
+    summary.index.name = "Metric"
+    return summary[["count", "unscored", "mean", "std", "min", *quantiles.columns, "max"]]
+
+
+def score_histograms(grades: pd.DataFrame, bins: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Number of results per score bucket (rows) for each metric (columns).
+    """
+    bins = SCORE_BINS if bins is None else bins
+    scores = _scores(grades)
+    buckets = pd.cut(scores, bins, right=False, include_lowest=True, labels=bins[:-1])
+    # Scores equal to the last edge (a perfect 10) belong to the top bucket
+    buckets = buckets.where(scores != bins[-1], bins[-2])
+    histogram = pd.crosstab(buckets, grades["Metric"].astype(str), dropna=True)
+    return histogram.reindex(bins[:-1], fill_value=0).rename_axis("Score")
+
+
+def score_pivot(grades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Numeric scores with one row per Index and one column per metric.
+    """
+    frame = pd.DataFrame({"Index": grades["Index"].to_numpy(), "Metric": grades["Metric"].astype(str).to_numpy(),
+                          "Score": _scores(grades).to_numpy()})
+    return frame.pivot_table(index="Index", columns="Metric", values="Score", aggfunc="last", dropna=False, sort=False)
+
+
+def score_correlation(grades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pearson correlation between the scores of every pair of metrics, over the rows graded by both.
+    """
+    return score_pivot(grades).corr()
@@ -1,10 +1,303 @@
+import hashlib
+import io
+import os
+import time
+from typing import Optional
+
+import openai
 import streamlit as st
 import pandas as pd
-import re
-import openai
 
-# Set OpenAI API key
-openai.api_key = st.secrets["OPENAI_API_KEY"]
+from analytics import CompactResults, score_correlation, score_histograms, score_pivot, score_summary
+from backends import BackendRouter, build_router
+from batch_mode import (PARTIAL_STATUSES, TERMINAL_STATUSES, LocalBatchClient, batch_client, batch_errors,
+                        check_batch_sheet, load_batch_state, record_batch_results, submit_batch)
+from evaluation import (KIND_COLUMNS, KIND_MODELS, cached_completion, default_system_prompt, detect_kind,
+                        evaluate_fused, evaluate_metric, load_sheet, metric_fingerprint, metric_model,
+                        system_prompt_budget_exceeded, validate_columns)
+from grading import DEFAULT_CONCURRENCY, MAX_CONCURRENCY, streamlit_progress
+from parsing import parse_failures
+from response_cache import ResponseCache
+from run_manifest import DONE, FAILED, PENDING, RunManifest
+from scheduler import RequestScheduler, configured_limits
+from streaming import (DEFAULT_CHUNK_SIZE, OUTPUT_FORMATS, export_results, iter_sheet_chunks, make_run_key,
+                       run_streaming_evaluation)
+from telemetry import Telemetry, serve_prometheus, telemetry_labels
+
+PREVIEW_ROWS = 5
+DEDUPE_OPTIONS = {"Grade every row": None, "Skip exact duplicates": "exact",
+                  "Skip near-duplicates (MinHash)": "near"}
+RUNS_DIR = os.path.join(".cache", "runs")
+
+
+
+@st.cache_resource
+def get_judge_backend() -> BackendRouter:
+    """
+    Build the judge backends (OpenAI, an optional OpenAI-compatible endpoint and the local mock)
+    from the app secrets once per server process, so their connection pools are reused.
+    """
+    return build_router(st.secrets)
+
+
+@st.cache_resource
+def get_telemetry() -> Telemetry:
+    """
+    Collect request telemetry once per server process; with a TELEMETRY_PORT secret the counters
+    are also served in Prometheus format at :TELEMETRY_PORT/metrics.
+    """
+    telemetry = Telemetry()
+    if st.secrets.get("TELEMETRY_PORT"):
+        serve_prometheus(telemetry, int(st.secrets["TELEMETRY_PORT"]))
+    return telemetry
+
+
+@st.cache_resource
+def get_scheduler() -> RequestScheduler:
+    """
+    Share one rate-limited request scheduler across reruns and sessions.
+    """
+    telemetry = get_telemetry()
+    return RequestScheduler(backend=get_judge_backend(), limits=configured_limits(st.secrets),
+                            on_retry=telemetry.record_retry, track=telemetry.track)
+
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """
+    Open the on-disk response cache once per server process.
+    """
+    return ResponseCache()
+
+
+@st.cache_resource
+def get_run_manifest() -> RunManifest:
+    """
+    Open the per-(Index, Metric) run manifest once per server process.
+    """
+    return RunManifest()
+
+
+@st.cache_data
+def load_uploaded_sheet(data: bytes, name: str) -> pd.DataFrame:
+    """
+    Parse the uploaded file once; widget interactions rerun the script but reuse the parsed sheet.
+    """
+    return load_sheet(io.BytesIO(data), name)
+
+
+@st.cache_data
+def load_uploaded_preview(data: bytes, name: str) -> pd.DataFrame:
+    """
+    Read only the first rows of the upload, enough to detect its format and show a preview.
+    """
+    return next(iter_sheet_chunks(io.BytesIO(data), name, PREVIEW_ROWS))
+
+
+telemetry = get_telemetry()
+scheduler = get_scheduler()
+response_cache = get_response_cache()
+run_manifest = get_run_manifest()
+complete = cached_completion(scheduler, response_cache, telemetry)
+
+
+def show_cache_stats() -> None:
+    stats = response_cache.stats()
+    st.caption(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} stored responses")
+
+
+def telemetry_caption(run_key: str, done: int = 0, total: int = 0, started_at: Optional[float] = None) -> str:
+    snapshot = telemetry.snapshot(run_key)
+    caption = (f"{snapshot['requests']} requests ({snapshot['cached']} cached), {snapshot['in_flight']} in flight, "
+               f"{snapshot['retries']} retries, ${snapshot['cost']:.4f} spent, p95 latency {snapshot['p95_seconds']:.2f}s, "
+               f"mean queue {snapshot['mean_queue_seconds']:.2f}s")
+    if started_at is not None and done:
+        elapsed = time.time() - started_at
+        caption += f" | {done / elapsed:.1f} rows/s, ETA {(total - done) * elapsed / done:.0f}s"
+    return caption
+
+
+def live_progress(label: str, run_key: str):
+    """
+    Progress bar plus a live line of request telemetry (throughput, in flight, retries, spend, ETA).
+    """
+    update_bar = streamlit_progress(label)
+    status = st.empty()
+    started_at = time.time()
+
+    def update(done: int, total: int) -> None:
+        update_bar(done, total)
+        status.caption(telemetry_caption(run_key, done, total, started_at))
+
+    return update
+
+
+def show_telemetry(run_key: str) -> None:
+    """
+    Per-metric request counts, tokens, spend and latency for the run, and its slowest requests.
+    """
+    with st.expander("Request telemetry"):
+        st.caption(telemetry_caption(run_key))
+        rollup = telemetry.rollup("metric", run_key)
+        if rollup:
+            st.dataframe(pd.DataFrame.from_dict(rollup, orient="index").rename_axis("Metric"))
+        slowest = telemetry.snapshot(run_key)["slowest"]
+        if slowest:
+            st.write("Slowest requests:")
+            st.dataframe(pd.DataFrame(slowest))
+
+
+def show_results(label: str, results: list, run_key: str) -> None:
+    st.session_state.combined_results.add(results)
+    st.write(f"Results for {label}:")
+    st.dataframe(pd.DataFrame(results))
+    show_cache_stats()
+    summary = run_manifest.summary(run_key)
+    st.caption(f"Run manifest: {summary[DONE]} done, {summary[FAILED]} failed, {summary[PENDING]} pending. "
+               "Running a metric again skips done rows and retries only failed ones.")
+    show_telemetry(run_key)
+    failures = parse_failures.stats(run_key)
+    if failures:
+        st.caption("Unparseable responses: " + ", ".join(
+            f"{name}: {counts['failures']} ({counts['fallbacks']} recovered by the free-text parser)"
+            for name, counts in failures.items()
+        ))
+
+
+def show_analytics(results: CompactResults) -> None:
+    """
+    Per-metric score statistics, distributions, correlations and the Index-by-metric score table.
+    """
+    st.write("Score summary by metric:")
+    st.dataframe(score_summary(results.grades))
+    st.write("Score distribution:")
+    st.bar_chart(score_histograms(results.grades))
+    if results.grades["Metric"].nunique() > 1:
+        st.write("Score correlation between metrics:")
+        st.dataframe(score_correlation(results.grades))
+    st.write("Scores by Index:")
+    st.dataframe(score_pivot(results.grades))
+
+
+@st.cache_resource
+def get_local_batch_client() -> LocalBatchClient:
+    """
+    Run batches for judges without a Batch API (http:/mock: models) in-process, keeping them once
+    per server process so a batch submitted in one rerun can be collected in the next.
+    """
+    return LocalBatchClient(get_judge_backend().create)
+
+
+def get_batch_client(metrics: list, kind: str):
+    """
+    The client the metrics' batch jobs go to (see batch_mode.batch_client). The OpenAI client is
+    created only when batch mode needs it, so deployments that judge with http:/mock: models need
+    no OpenAI key. Shows an error and returns None without one.
+    """
+    try:
+        return batch_client(get_judge_backend(), metrics, kind, get_local_batch_client())
+    except openai.OpenAIError as e:
+        st.error(f"Batch mode needs an OpenAI API key: {e}")
+        return None
+
+
+def show_batch_panel(load_df, metrics: list, kind: str, run_key: str) -> None:
+    """
+    Submit every (row, metric) evaluation as an OpenAI Batch API job (run in-process for other
+    judges), or collect the results of an earlier job by its batch id.
+    """
+    results = None
+    with st.expander("Batch mode (OpenAI Batch API)"):
+        st.write("Submit all metrics as one offline batch job at batch pricing. Keep the batch id and "
+                 "re-upload the same file later to collect the results.")
+        if st.button("Submit Batch Job", key="submit_batch"):
+            client = get_batch_client(metrics, kind)
+            if any(metric["system_prompt"].strip() == "" for metric in metrics):
+                st.error("Please enter a valid system prompt for every metric.")
+            elif client is not None:
+                st.session_state.batch_id = submit_batch(client, load_df(), metrics, kind)
+                st.success(f"Submitted batch {st.session_state.batch_id}.")
+
+        batch_id = st.text_input("Batch id:", value=st.session_state.get("batch_id", ""), key="resume_batch_id").strip()
+        if batch_id and st.button("Collect Batch Results", key="collect_batch"):
+            state = load_batch_state(batch_id) or {"kind": kind, "metrics": metrics}
+            client = get_batch_client(state["metrics"], kind)
+            if client is None:
+                return
+            batch = client.batches.retrieve(batch_id)
+            df = load_df()
+            try:
+                check_batch_sheet(state, df, kind)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            if batch.status not in TERMINAL_STATUSES:
+                st.info(f"Batch {batch_id} is {batch.status}. Check again later.")
+            elif batch.status == "failed":
+                st.error(f"Batch {batch_id} failed: {batch_errors(batch)}")
+            else:
+                if batch.status in PARTIAL_STATUSES:
+                    st.warning(f"Batch {batch_id} {batch.status} before every request finished. Rows without a "
+                               "response are recorded as failed and can be re-graded interactively.")
+                with telemetry_labels(run=run_key):
+                    results = record_batch_results(client, batch, df, state, kind, run_manifest, run_key)
+    # Outside the expander, which cannot hold show_results' own telemetry expander
+    if results is not None:
+        show_results(f"Batch {batch_id}", results, run_key)
+
+
+def show_streaming_panel(uploaded_file, metrics: list, kind: str, fused: bool, dedupe: Optional[str]) -> None:
+    """
+    Grade all metrics chunk by chunk, appending results to disk as each chunk finishes, and
+    offer the output file for download. Restarting the same run resumes after the last
+    committed chunk.
+    """
+    with st.expander("Streaming run (large sheets)"):
+        st.write("Results are written to disk after every chunk instead of being kept in the session. "
+                 "If a run is interrupted, start it again with the same file and metrics to resume.")
+        chunk_size = st.number_input("Rows per chunk:", min_value=1, value=DEFAULT_CHUNK_SIZE, step=100, key="chunk_size")
+        output_format = st.selectbox("Output format:", OUTPUT_FORMATS, key="output_format")
+
+        if st.button("Run All Metrics (Streaming)", key="run_streaming"):
+            if any(metric["system_prompt"].strip() == "" for metric in metrics):
+                st.error("Please enter a valid system prompt for every metric.")
+            else:
+                data = uploaded_file.getvalue()
+                run_key = make_run_key(hashlib.sha256(data).hexdigest(), metrics, fused, dedupe)
+                run_dir = os.path.join(RUNS_DIR, run_key[:16])
+                journal_path = os.path.join(run_dir, "results.partial.csv")
+                status = st.empty()
+                telemetry_status = st.empty()
+
+                def on_chunk(progress: dict) -> None:
+                    status.write(f"Committed {progress['chunks']} chunks: {progress['rows']} rows graded.")
+                    telemetry_status.caption(telemetry_caption(run_key))
+
+                warn_if_truncated(metrics, kind)
+                with telemetry_labels(run=run_key):
+                    run_streaming_evaluation(io.BytesIO(data), uploaded_file.name, metrics, complete, journal_path,
+                                             run_key, chunk_size, fused, max_concurrency, on_chunk, run_manifest,
+                                             dedupe)
+                st.session_state.streaming_output = export_results(
+                    journal_path, os.path.join(run_dir, f"results{output_format}"), chunk_size
+                )
+                st.success("Streaming run complete.")
+                show_cache_stats()
+
+        output_path = st.session_state.get("streaming_output")
+        if output_path and os.path.exists(output_path):
+            with open(output_path, "rb") as handle:
+                st.download_button("Download Results", handle, file_name=os.path.basename(output_path),
+                                   key="download_streaming")
+
+
+def warn_if_truncated(metrics: list, kind: str) -> None:
+    for metric in metrics:
+        budget = system_prompt_budget_exceeded(metric, kind)
+        if budget is not None:
+            st.warning(f"The system prompt for {metric['name']} exceeds the {budget}-token budget for "
+                       f"{metric_model(metric, kind)} and will be shortened.")
+
 
 # Streamlit UI
 st.markdown("<h1 style='text-align: center;'>LLM Evaluation Tool</h1>", unsafe_allow_html=True)
@@ -14,27 +307,52 @@ st.write("2. Columns: Index, Conversation, Agent Prompt")
 
 uploaded_file = st.file_uploader("Upload your Excel file", type=["xlsx", "csv"])
 
+# Number of OpenAI requests kept in flight at once while grading
+max_concurrency = st.number_input(
+    "Concurrent grading requests:", min_value=1, max_value=MAX_CONCURRENCY, value=DEFAULT_CONCURRENCY, step=1
+)
+
+with st.expander("Response cache"):
+    show_cache_stats()
+    if st.button("Clear response cache"):
+        response_cache.clear()
+        st.success("Response cache cleared.")
+
 if uploaded_file:
     try:
-        # Read uploaded file
-        if uploaded_file.name.endswith(".xlsx"):
-            df = pd.read_excel(uploaded_file)
-        else:
-            df = pd.read_csv(uploaded_file)
-
-        if "Question" in df.columns and "Context" in df.columns and "Answer" in df.columns:
-            # Code 1 processing
-            required_columns = ["Index", "Question", "Context", "Answer", "Reference Context", "Reference Answer"]
-            if not all(col in df.columns for col in required_columns):
-                st.error(f"The uploaded file must contain these columns: {', '.join(required_columns)}.")
+        # Read the first rows of the uploaded file; the full sheet is only parsed when grading interactively
+        preview = load_uploaded_preview(uploaded_file.getvalue(), uploaded_file.name)
+        kind = detect_kind(preview)
+
+        def load_df() -> pd.DataFrame:
+            return load_uploaded_sheet(uploaded_file.getvalue(), uploaded_file.name)
+
+        # Results recorded in the run manifest are keyed on the uploaded file's content
+        run_key = make_run_key(hashlib.sha256(uploaded_file.getvalue()).hexdigest())
+
+        if kind is not None:
+            required_columns = KIND_COLUMNS[kind]
+            try:
+                validate_columns(preview, kind)
+            except ValueError as e:
+                st.error(str(e))
             else:
                 st.write("Preview of Uploaded Data:")
-                st.dataframe(df.head())
+                st.dataframe(preview)
 
                 num_metrics = st.number_input("Enter the number of metrics you want to define:", min_value=1, step=1)
 
-                if "combined_results" not in st.session_state:
-                    st.session_state.combined_results = []
+                # Structured output: JSON grades with a numeric 0-10 Score instead of free text
+                structured_output = st.checkbox("Structured output (JSON grades with a numeric score)", key="structured_output")
+
+                # Duplicate rows get the result of the first row like them (marked in "Inferred From")
+                dedupe_mode = DEDUPE_OPTIONS[st.selectbox("Duplicate rows:", list(DEDUPE_OPTIONS), key="dedupe_mode")]
+
+                # Results of this session, stored column-wise with the input text kept once per Index
+                if "combined_results" not in st.session_state or st.session_state.combined_results.kind != kind:
+                    st.session_state.combined_results = CompactResults(kind)
+
+                metrics = []
 
                 for i in range(num_metrics):
                     st.markdown(f"""
@@ -46,7 +364,7 @@ if uploaded_file:
 
                     selected_columns = st.multiselect(
                         f"Select columns for Metric {i + 1}:",
-                        options=required_columns[1:],
+                        options=required_columns[1:],  # Skip the Index column
                         key=f"columns_{i}"
                     )
 
@@ -55,323 +373,78 @@ if uploaded_file:
                     )
 
                     if toggle_prompt:
-                        if i % 2 == 0:
-                            system_prompt = """You are a RELEVANCE grader; providing the relevance of the given question to the given answer.
-                                            Respond only as a number from 0 to 10 where 0 is the least relevant and 10 is the most relevant. 
-                                        
-                                            A few additional scoring guidelines:
-                                            - Long answer should score equally well as short answer.
-                                            - RELEVANCE score should increase as the answer provides more RELEVANT context to the question.
-                                            - RELEVANCE score should increase as the answer provides RELEVANT context to more parts of the question.
-                                            - Answer that is RELEVANT to some of the question should score of 2, 3, or 4. Higher score indicates more RELEVANCE.
-                                            - Answer that is RELEVANT to most of the question should get a score of 5, 6, 7, or 8. Higher score indicates more RELEVANCE.
-                                            - Answer that is RELEVANT to the entire question should get a score of 9 or 10. Higher score indicates more RELEVANCE.
-                                            - Answer must be relevant and helpful for answering the entire question to get a score of 10.
-                                            - Never elaborate."""
-                        else:
-                            system_prompt = """You are a FACTUAL ACCURACY grader; evaluating the factual correctness of the given answer based on the question and context.  
-                                                Respond only as a number from 0 to 10 where 0 indicates completely factually inaccurate and 10 indicates completely factually accurate.  
-                                                
-                                                A few additional scoring guidelines:  
-                                                - Long answers should score equally well as short answers if they are factually accurate.  
-                                                - The FACTUAL ACCURACY score should increase as the answer contains more factually correct information related to the question and context.  
-                                                - The presence of minor factual inaccuracies should lead to scores of 2, 3, or 4. Higher scores indicate fewer inaccuracies.  
-                                                - If most parts of the answers are factually correct, the score should be 5, 6, 7, or 8. Higher scores indicate greater factual accuracy.  
-                                                - If the entire answer is factually accurate and aligned with the question and context, the score should be 9 or 10.  
-                                                - The answer must strictly avoid fabrications or contradictions to achieve a score of 10.  
-                                                - Never elaborate."""
-
+                        system_prompt = default_system_prompt(kind, i)
                         st.text_area(
                             f"Generated System Prompt for Metric {i + 1}:",
                             value=system_prompt,
                             height=200
                         )
+                        if kind == "conversation":
+                            st.success(f"System Prompt for Metric {i + 1} is Generated")
                     else:
                         system_prompt = st.text_area(
                             f"Enter the System Prompt for Metric {i + 1}:",
                             height=200
                         )
 
-                    if st.button(f"Metric {i + 1} Results", key=f"generate_results_{i}"):
-                        column_mapping = {
-                            "Question": "question",
-                            "Context": "context",
-                            "Answer": "answer",
-                            "Reference Context": "reference_context",
-                            "Reference Answer": "reference_answer"
-                        }
-                        results = []
-                        for index, row in df.iterrows():
-                            params = {"system_prompt": system_prompt}
-                            for col in selected_columns:
-                                if col in column_mapping:
-                                    params[column_mapping[col]] = row[col]
-
-                            try:
-                                # Constructing the evaluation prompt with system prompt and column values
-                                                                # Constructing the evaluation prompt with system prompt and column values
-                                evaluation_prompt = f"""
-                                {system_prompt}
-
-                                Below is the data for evaluation:
-                                {''.join([f'{col}: {row[col]}\n' for col in selected_columns])}
-
-                                Based on the provided data, evaluate the following in this exact format:
-                                1. Criteria: [Provide a detailed explanation of how the evaluation is derived.]
-                                2. Supporting Evidence: [Provide specific examples from the data supporting the evaluation.]
-                                3. Score: [Provide a numerical or qualitative score.]
-
-                                Ensure the response strictly follows this format with numbered headings.
-                                """
-
-                                response = openai.chat.completions.create(
-                                    model="gpt-4o-mini",
-                                    messages=[
-                                        {"role": "system", "content": "You are an evaluator analyzing the provided data."},
-                                        {"role": "user", "content": evaluation_prompt}
-                                    ]
-                                )
-                                response_content = response.choices[0].message.content.strip()
-                                #st.write(response_content)
-
-                                # Parsing the GPT response for Criteria, Supporting Evidence, and Score
-                                criteria_match = re.search(r"1\.\s*Criteria:\s*(.*?)(?=\n2\.)", response_content, re.S)
-                                evidence_match = re.search(r"2\.\s*Supporting Evidence:\s*(.*?)(?=\n3\.)", response_content, re.S)
-                                score_match = re.search(r"3\.\s*Score:\s*(.*)", response_content)
-
-                                criteria = criteria_match.group(1).strip() if criteria_match else "Not available"
-                                evidence = evidence_match.group(1).strip() if evidence_match else "Not available"
-                                score = score_match.group(1).strip() if score_match else "Not available"
-
-
-
-                                result_row = {
-                                    "Index": row["Index"],
-                                    "Metric": f"Metric {i + 1}",
-                                    "Selected Columns": ", ".join(selected_columns),
-                                    "Score": score,
-                                    "Criteria": criteria,
-                                    "Supporting Evidence": evidence,
-                                    "Question": row["Question"],
-                                    "Context": row["Context"],
-                                    "Answer": row["Answer"],
-                                    "Reference Context": row["Reference Context"],
-                                    "Reference Answer": row["Reference Answer"]
-                                }
-                                results.append(result_row)
-                            except Exception as e:
-                                results.append({
-                                    "Index": row["Index"],
-                                    "Metric": f"Metric {i + 1}",
-                                    "Selected Columns": ", ".join(selected_columns),
-                                    "Score": "Error",
-                                    "Criteria": "Error",
-                                    "Supporting Evidence": "Error",
-                                    "Question": row["Question"],
-                                    "Context": row["Context"],
-                                    "Answer": row["Answer"],
-                                    "Reference Context": row["Reference Context"],
-                                    "Reference Answer": row["Reference Answer"],
-                                    "Error": str(e)
-                                })
-
-                        st.session_state.combined_results.extend(results)
-                        st.write(f"Results for Metric {i + 1}:")
-                        st.dataframe(pd.DataFrame(results))
-
-                if num_metrics > 1 and st.button("Overall Results"):
-                    if st.session_state.combined_results:
-                        st.write("Combined Results:")
-                        st.dataframe(pd.DataFrame(st.session_state.combined_results))
-                    else:
-                        st.warning("No results to combine. Please generate results for individual metrics first.")
-
-        #elif "Conversation" in df.columns and "Agent Prompt" in df.columns:
-        # Agentic Testing (Code 2 processing with updates for lengthy prompts)
-        elif "Conversation" in df.columns and "Agent Prompt" in df.columns:
-            # Code 2 processing
-            required_columns = ["Index", "Conversation", "Agent Prompt"]
-            if not all(col in df.columns for col in required_columns):
-                st.error(f"The uploaded file must contain these columns: {', '.join(required_columns)}.")
-            else:
-                st.write("Preview of Uploaded Data:")
-                st.dataframe(df.head())
-                
-                MAX_PROMPT_LENGTH = 2000  # Define maximum allowable characters for the system prompt
-                
-                def truncate_prompt(prompt: str, max_length: int = MAX_PROMPT_LENGTH) -> str:
-                    """
-                    Truncate the prompt to fit within the allowed maximum length.
-                    """
-                    if len(prompt) > max_length:
-                        return prompt[:max_length] + "..."
-                    return prompt
-                
-                # Define function to evaluate conversation using GPT-4
-                def evaluate_conversation(system_prompt: str, selected_columns: list, conversation: pd.DataFrame, metric_name: str) -> list:
-                    """
-                    Evaluate the conversation using GPT-4 based on the system prompt provided by the user.
-                    """
-                    results = []
-                    
-                    # Truncate the system prompt if it's too long
-                    if len(system_prompt) > MAX_PROMPT_LENGTH:
-                        st.warning(f"The system prompt exceeds {MAX_PROMPT_LENGTH} characters and will be truncated.")
-                        system_prompt = truncate_prompt(system_prompt)
-                    
-                    for index, row in conversation.iterrows():
-                        try:
-                            # Construct the evaluation prompt for GPT-4
-                            evaluation_prompt = f"""
-                            System Prompt: {system_prompt}
-                
-                            Index: {row['Index']}
-                            Conversation: {row['Conversation']}
-                            Agent Prompt: {row['Agent Prompt']}
-                
-                            Evaluate the entire conversation for Agent-Goal Accuracy. Use the following format:
-                            
-                            Criteria: [Explain how well the Agent responded to the User's input and fulfilled their goals]
-                            Supporting Evidence: [Highlight specific faulty or insufficient responses from the Agent]
-                            Score: [Provide a numerical or qualitative score here]
-                            """
-                
-                            # Call GPT-4 API
-                            completion = openai.chat.completions.create(
-                                model="gpt-4",
-                                messages=[
-                                    {"role": "system", "content": "You are an evaluator analyzing agent conversations."},
-                                    {"role": "user", "content": evaluation_prompt}
-                                ]
-                            )
-                
-                            response_content = completion.choices[0].message.content.strip()
-                
-                            # Parse GPT-4 response into structured format
-                            parsed_response = {
-                                "Index": row["Index"],
-                                "Metric": metric_name,
-                                "Selected Columns": ", ".join(selected_columns),
-                                "Score": "",
-                                "Criteria": "",
-                                "Supporting Evidence": "",
-                                "Agent Prompt": row.get("Agent Prompt", ""),
-                                "Conversation": row.get("Conversation", "")
-                            }
-                
-                            # Extract values for Criteria, Supporting Evidence, and Score
-                            for line in response_content.split("\n"):
-                                line = line.strip()
-                                if line.startswith("Criteria:"):
-                                    parsed_response["Criteria"] = line.replace("Criteria:", "").strip()
-                                elif line.startswith("Supporting Evidence:"):
-                                    parsed_response["Supporting Evidence"] = line.replace("Supporting Evidence:", "").strip()
-                                elif line.startswith("Score:"):
-                                    parsed_response["Score"] = line.replace("Score:", "").strip()
-                
-                            # Validate extracted structure
-                            if not (parsed_response["Criteria"] and parsed_response["Supporting Evidence"] and parsed_response["Score"]):
-                                raise ValueError("Response does not contain the required structured fields.")
-                
-                            results.append(parsed_response)
-                
-                        except Exception as e:
-                            results.append({
-                                "Index": row["Index"],
-                                "Metric": metric_name,
-                                "Selected Columns": ", ".join(selected_columns),
-                                "Score": "N/A",
-                                "Criteria": "Error",
-                                "Supporting Evidence": f"Error processing conversation: {e}",
-                                "Agent Prompt": row.get("Agent Prompt", ""),
-                                "Conversation": row.get("Conversation", "")
-                            })
-                
-                    return results
-
-                num_metrics = st.number_input("Enter the number of metrics you want to define:", min_value=1, step=1)
-        
-                if "system_prompts" not in st.session_state:
-                    st.session_state.system_prompts = {}
-                if "combined_results" not in st.session_state:
-                    st.session_state.combined_results = []
-
-                for i in range(num_metrics):
-                    st.markdown(f"""
-                        <hr style="border: 5px solid #000000;">
-                        <h3 style="background-color: #f0f0f0; padding: 10px; border: 2px solid #000000;">
-                            Metric {i + 1}
-                        </h3>
-                    """, unsafe_allow_html=True)
-
-                    # Column selection remains unchanged
-                    selected_columns = st.multiselect(
-                        f"Select columns for Metric {i + 1}:",
-                        options=required_columns[1:],  # Skip the Index column
-                        key=f"columns_{i}"
-                    )
-
-                    toggle_prompt = st.checkbox(
-                        f"Automatically generate system prompt for Metric {i + 1}", key=f"toggle_prompt_{i}"
+                    # Judge model: "<model>" for OpenAI, "http:<model>" for the JUDGE_BASE_URL endpoint,
+                    # "mock:<model>" for the local deterministic judge
+                    judge_model = st.text_input(
+                        f"Judge model for Metric {i + 1}:", value=KIND_MODELS[kind], key=f"model_{i}",
+                        help="An OpenAI model, http:<model> for the configured OpenAI-compatible endpoint, "
+                             "or mock:judge for the local test judge."
                     )
 
-
-
-                    if toggle_prompt:
-               
-                      system_prompt = """Role: You are responsible for evaluating the AGENT-GOAL ACCURACY of a conversation based on its alignment with the AGENT PROMPT.  
-
-                                        Scoring Scale (0-10):  
-                                        0 indicates the responses are entirely unrelated to the AGENT PROMPT.  
-                                        1 to 4 reflects limited alignment, lacking depth, precision, or relevance. Scores of 1 to 2 represent negligible coverage with minimal helpfulness, while 3 to 4 indicate partial coverage with insufficient detail or completeness.  
-                                        5 to 8 represents reasonable alignment with clear and relevant responses. Scores of 5 to 6 cover most of the prompt but have significant gaps, while 7 to 8 reflect strong alignment with minor omissions or gaps.  
-                                        9 to 10 signifies comprehensive alignment with precise, complete, and entirely relevant responses. A score of 9 is near-perfect with minimal imperfections, and a score of 10 is fully sufficient and flawlessly aligned.  
-                                        
-                                        Criteria for evaluation include how well the agent responses address user inputs and the AGENT PROMPT, the accuracy, relevance, and helpfulness of the responses, and the completeness and precision in meeting the context of the AGENT PROMPT.  
-                                        
-                                        Supporting evidence should highlight areas of strong alignment and fulfillment of goals while identifying specific faults, such as misunderstanding, inaccuracy, or incompleteness, that detract from the relevance or helpfulness of the responses.  
-                                        
-                                        Output must be a single numerical score between 0 and 10 with no additional text.
-                                        """
-        
-
-                      st.text_area(
-                        f"Generated System Prompt for Metric {i + 1}:", value=system_prompt, height=200
-                        )
-                      st.success(f"System Prompt for Metric {i + 1} is Generated")
-
-                    else:
-                        system_prompt = st.text_area(
-                            f"Enter the System Prompt for Metric {i + 1}:",
-                            height=200
-                        )
-                    
+                    metric = {"name": f"Metric {i + 1}", "system_prompt": system_prompt, "columns": selected_columns,
+                              "structured": structured_output, "model": judge_model.strip() or None}
+                    metrics.append(metric)
 
                     # Generate results for each metric
                     if st.button(f"Metric {i + 1} Results", key=f"generate_results_{i}"):
-                        if system_prompt.strip() == "":
+                        if kind == "conversation" and system_prompt.strip() == "":
                             st.error("Please enter a valid system prompt.")
                         else:
-                            st.write("Evaluating conversations. Please wait...")
+                            warn_if_truncated([metric], kind)
+                            with telemetry_labels(run=run_key):
+                                results = evaluate_metric(
+                                    load_df(), metric, kind, complete, max_concurrency,
+                                    live_progress(f"Grading Metric {i + 1}:", run_key), run_manifest, run_key,
+                                    dedupe_mode
+                                )
+                            show_results(f"Metric {i + 1}", results, run_key)
+
+                # Fused mode: one request per row grades every metric, instead of one request per metric
+                fused_mode = num_metrics > 1 and st.checkbox("Fused mode: grade all metrics for a row in a single request", key="fused_mode")
+                if fused_mode:
+                    if st.button("All Metrics Results (Fused)", key="generate_fused_results"):
+                        if any(metric["system_prompt"].strip() == "" for metric in metrics):
+                            st.error("Please enter a valid system prompt for every metric.")
+                        else:
+                            warn_if_truncated(metrics, kind)
+                            with telemetry_labels(run=run_key):
+                                results = evaluate_fused(
+                                    load_df(), metrics, kind, complete, max_concurrency,
+                                    live_progress("Grading all metrics:", run_key), run_manifest, run_key,
+                                    dedupe_mode
+                                )
+                            show_results("All Metrics", results, run_key)
 
-                            results = evaluate_conversation(system_prompt, selected_columns, df, f"Metric {i + 1}")
-                            st.session_state.combined_results.extend(results)
-                            st.write(f"Results for Metric {i + 1}:")
-                            st.dataframe(pd.DataFrame(results))
+                show_streaming_panel(uploaded_file, metrics, kind, fused_mode, dedupe_mode)
+                show_batch_panel(load_df, metrics, kind, run_key)
 
                 # Combine results for all metrics
-                # Check if there are combined results before displaying them
                 if num_metrics > 1 and st.button("Overall Results"):
-                    try:
-                        if st.session_state.combined_results:
-                            st.write("Combined Results:")
-                            st.dataframe(pd.DataFrame(st.session_state.combined_results))
-                        else:
-                            st.warning("No results to combine. Please generate results for individual metrics first.")
-                    except Exception as e:
-                        st.error(f"Error displaying combined results: {e}")
-
+                    # Results from earlier sessions on the same file come from the run manifest
+                    combined_results = CompactResults.from_results(run_manifest.results(run_key, {
+                        metric["name"]: metric_fingerprint(metric, kind) for metric in metrics
+                    }), kind)
+                    combined_results.add(st.session_state.combined_results.frame())
+                    if len(combined_results):
+                        st.write("Combined Results:")
+                        st.dataframe(combined_results.frame())
+                        show_analytics(combined_results)
+                    else:
+                        st.warning("No results to combine. Please generate results for individual metrics first.")
 
-    
     except Exception as e:
         st.error(f"Error processing the uploaded file: {e}")
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Mapping, Optional
+
+import httpx
+import openai
+
+from budget import COLUMN_TOKEN_BUDGETS, register_backend_budgets
+from scheduler import DEFAULT_LIMITS, MODEL_LIMITS, estimate_prompt_tokens
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_TIMEOUT = 120.0  # Seconds before a judge request is abandoned (and retried by the scheduler)
+MAX_CONNECTIONS = 64  # Matches grading.MAX_CONCURRENCY, so every in-flight request gets a pooled connection
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 30.0
+
+MOCK_MODEL = "mock:judge"
+# Judges that are not metered per minute (the mock, self-hosted endpoints) are only limited by their latency
+UNTHROTTLED_LIMITS = {"rpm": 1_000_000, "tpm": 1_000_000_000}
+MOCK_LIMITS = UNTHROTTLED_LIMITS
+
+_FUSED_HEADING = re.compile(r"^### (.+)$", re.M)
+
+
+def as_namespace(value):
+    """
+    Turn a decoded chat completion into attribute-style objects, like the openai SDK's responses.
+    """
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: as_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [as_namespace(item) for item in value]
+    return value
+
+
+def status_error(response: httpx.Response):
+    """
+    Convert an HTTP error response into the openai exception the scheduler knows how to retry.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    message = f"Error code: {response.status_code} - {body}"
+    if response.status_code == 429:
+        return openai.RateLimitError(message, response=response, body=body)
+    if response.status_code >= 500:
+        return openai.InternalServerError(message, response=response, body=body)
+    return openai.APIStatusError(message, response=response, body=body)
+
+
+class JudgeBackend:
+    """
+    Sends chat completion requests to one family of judge models.
+
+    create(model, messages, **params) returns an object shaped like the openai SDK's chat
+    completion (choices[0].message.content and usage.total_tokens) and raises the openai
+    exception types for failures, so RequestScheduler can rate-limit and retry any backend.
+
+    token_budgets (per field, see budget.py) overrides the budgets of the backend's models when
+    prompts are compacted; None uses each model's own.
+    """
+
+    token_budgets = None
+
+    def create(self, model: str, messages: list, **params):
+        raise NotImplementedError
+
+    def limits_for(self, model: str) -> Optional[dict]:
+        """
+        Requests/tokens per minute allowed for the model, or None for the scheduler's default.
+        """
+        return MODEL_LIMITS.get(model)
+
+    def close(self) -> None:
+        pass
+
+
+class OpenAIBackend(JudgeBackend):
+    """
+    OpenAI models through the official SDK client.
+    """
+
+    def __init__(self, client=None, api_key: Optional[str] = None):
+        self._client = client
+        self.api_key = api_key
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use, so routers without an OpenAI key still work for other backends.
+        # Retries are left to the scheduler.
+        with self.lock:
+            if self._client is None:
+                self._client = openai.OpenAI(api_key=self.api_key, max_retries=0)
+            return self._client
+
+    def create(self, model: str, messages: list, **params):
+        return self.client.chat.completions.create(model=model, messages=messages, **params)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+
+class HTTPBackend(JudgeBackend):
+    """
+    Any OpenAI-compatible /chat/completions endpoint (vLLM, Ollama, Groq, Azure proxies, ...),
+    called with one pooled keep-alive httpx client shared by all grading threads.
+
+    limits (rpm and/or tpm) applies to every model of the endpoint. Without it, OpenAI's own
+    endpoint keeps the per-model MODEL_LIMITS and any other endpoint is left unthrottled.
+    """
+
+    def __init__(self, base_url: str = OPENAI_BASE_URL, api_key: Optional[str] = None,
+                 timeout: float = DEFAULT_TIMEOUT, max_connections: int = MAX_CONNECTIONS,
+                 limits: Optional[dict] = None, token_budgets: Optional[dict] = None):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.base_url = base_url.rstrip("/")
+        self.rate_limits = limits
+        self.token_budgets = token_budgets
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=min(MAX_KEEPALIVE_CONNECTIONS, max_connections),
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+
+    def create(self, model: str, messages: list, **params):
+        try:
+            response = self.client.post("/chat/completions", json={"model": model, "messages": messages, **params})
+        except httpx.TimeoutException as e:
+            raise openai.APITimeoutError(request=e.request) from e
+        except httpx.TransportError as e:
+            raise openai.APIConnectionError(request=e.request) from e
+        if response.status_code >= 400:
+            raise status_error(response)
+        return as_namespace(response.json())
+
+    def limits_for(self, model: str) -> Optional[dict]:
+        if self.base_url == OPENAI_BASE_URL:
+            defaults = super().limits_for(model)
+            if self.rate_limits is None:
+                return defaults
+            return {**(defaults or DEFAULT_LIMITS), **self.rate_limits}
+        return {**UNTHROTTLED_LIMITS, **(self.rate_limits or {})}
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def mock_reply(model: str, messages: list, params: dict) -> str:
+    """
+    A well-formed grade for the prompt, in whichever format it asks for. The score is derived
+    from a hash of the model and prompt, so the same request always gets the same grade.
+    """
+    prompt = messages[-1]["content"]
+    fused = "separate metrics" in prompt
+    names = list(dict.fromkeys(_FUSED_HEADING.findall(prompt.split("Below is the data")[0]))) if fused else [None]
+    structured = "JSON object" in prompt or "response_format" in params
+
+    def score(name: Optional[str]) -> int:
+        digest = hashlib.sha256(f"{model}\n{name}\n{prompt}".encode("utf-8")).digest()
+        return digest[0] % 11
+
+    grades = {name: {"criteria": "Deterministic mock grade.", "supporting_evidence": "Generated by the mock backend.",
+                     "score": score(name)} for name in names}
+    if structured:
+        return json.dumps(grades if fused else grades[None])
+
+    numbered = "1. Criteria" in prompt
+    sections = []
+    for name, grade in grades.items():
+        if numbered:
+            text = (f"1. Criteria: {grade['criteria']}\n2. Supporting Evidence: {grade['supporting_evidence']}\n"
+                    f"3. Score: {grade['score']}")
+        else:
+            text = (f"Criteria: {grade['criteria']}\nSupporting Evidence: {grade['supporting_evidence']}\n"
+                    f"Score: {grade['score']}")
+        sections.append(f"### {name}\n{text}" if fused else text)
+    return "\n\n".join(sections)
+
+
+class MockBackend(JudgeBackend):
+    """
+    Local stand-in judge that answers every prompt with a deterministic, well-formed grade after
+    latency seconds (plus up to jitter seconds), failing a random error_rate share of requests
+    with retryable 500s. Used to benchmark the pipeline without paying for live calls.
+    """
+
+    # Prompts are compacted as for the default judge model, which the mock stands in for
+    token_budgets = COLUMN_TOKEN_BUDGETS["gpt-4o-mini"]
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def create(self, model: str, messages: list, **params):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            request = httpx.Request("POST", "http://mock/chat/completions")
+            raise status_error(httpx.Response(500, json={"error": "mock failure"}, request=request))
+
+        content = mock_reply(model, messages, params)
+        prompt_tokens = estimate_prompt_tokens(messages, model)
+        completion_tokens = max(len(content) // 4, 1)
+        return as_namespace({
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def limits_for(self, model: str) -> Optional[dict]:
+        return MOCK_LIMITS
+
+
+class BackendRouter(JudgeBackend):
+    """
+    Routes each request to a backend by model name. "<backend>:<model>" (for example
+    "mock:judge" or "http:llama3:8b") selects a registered backend; any other name goes
+    to the default backend unchanged.
+    """
+
+    def __init__(self, backends: dict, default: str = "openai"):
+        self.backends = backends
+        self.default = default
+        for name, backend in backends.items():
+            register_backend_budgets(name, backend.token_budgets)
+
+    def resolve(self, model: str) -> tuple:
+        prefix, _, name = model.partition(":")
+        if name and prefix in self.backends:
+            return self.backends[prefix], name
+        return self.backends[self.default], model
+
+    def create(self, model: str, messages: list, **params):
+        backend, name = self.resolve(model)
+        return backend.create(name, messages, **params)
+
+    def limits_for(self, model: str) -> Optional[dict]:
+        backend, name = self.resolve(model)
+        return backend.limits_for(name)
+
+    def close(self) -> None:
+        for backend in self.backends.values():
+            backend.close()
+
+
+def json_setting(settings: Mapping, name: str):
+    """
+    A setting given as a JSON string (environment variables) or as an already parsed table (app secrets).
+    """
+    value = settings.get(name)
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def build_router(settings: Mapping) -> BackendRouter:
+    """
+    Build the judge backends from app secrets or environment variables:
+
+        OPENAI_API_KEY              key for the "openai" backend (the default)
+        JUDGE_BASE_URL, JUDGE_API_KEY
+                                    an OpenAI-compatible endpoint, used for "http:<model>"
+        JUDGE_TOKEN_BUDGETS         JSON object of per-field token budgets for that endpoint's
+                                    models, e.g. {"Conversation": 16000} (see budget.py)
+        JUDGE_RATE_LIMITS           JSON object of requests/tokens per minute for that endpoint,
+                                    e.g. {"rpm": 30, "tpm": 6000}; unthrottled when unset
+        MOCK_LATENCY, MOCK_ERROR_RATE
+                                    behaviour of the local "mock:<model>" judge
+    """
+    backends = {
+        "openai": OpenAIBackend(api_key=settings.get("OPENAI_API_KEY")),
+        "mock": MockBackend(latency=float(settings.get("MOCK_LATENCY", 0.0)),
+                            error_rate=float(settings.get("MOCK_ERROR_RATE", 0.0))),
+    }
+    if settings.get("JUDGE_BASE_URL"):
+        backends["http"] = HTTPBackend(settings["JUDGE_BASE_URL"], settings.get("JUDGE_API_KEY"),
+                                       limits=json_setting(settings, "JUDGE_RATE_LIMITS"),
+                                       token_budgets=json_setting(settings, "JUDGE_TOKEN_BUDGETS"))
+    return BackendRouter(backends)
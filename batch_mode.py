@@ -0,0 +1,248 @@
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import pandas as pd
+
+from evaluation import (build_messages, build_prompt, error_result, metric_fingerprint, metric_model, record_result,
+                        request_params, result_from_response, row_key, validate_index)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+BATCH_STATE_DIR = os.path.join(".cache", "batches")
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Final statuses whose requests that finished before the batch stopped still have output to collect
+PARTIAL_STATUSES = {"expired", "cancelled"}
+DEFAULT_POLL_INTERVAL = 30  # Seconds between batch status checks
+
+
+def custom_id(position: int, row: pd.Series, metric_name: str) -> str:
+    # With the Index in the id, rows of a different sheet get no response instead of another row's grade
+    return f"row-{position}-{row_key(row)}::{metric_name}"
+
+
+def sheet_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Hash of the sheet's contents, saved with a batch so its results are only collected against the same sheet.
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def build_batch_requests(df: pd.DataFrame, metrics: list, kind: str) -> tuple:
+    """
+    Turn every (row, metric) evaluation into a Batch API request line.
+
+    kind is "metric" for Question/Context/Answer sheets or "conversation" for agentic sheets.
+    metrics is a list of {"name", "system_prompt", "columns"} dicts. Returns (request lines,
+    {custom_id: tokens trimmed from its prompt}).
+    """
+    validate_index(df)
+    requests, trimmed = [], {}
+    for position, (_, row) in enumerate(df.iterrows()):
+        for metric in metrics:
+            evaluation_prompt, trimmed_tokens = build_prompt(row, metric, kind)
+            body = {"model": metric_model(metric, kind), "messages": build_messages(evaluation_prompt, kind),
+                    **request_params(metric, kind)}
+            key = custom_id(position, row, metric["name"])
+            requests.append({"custom_id": key, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+            trimmed[key] = trimmed_tokens
+    return requests, trimmed
+
+
+def write_batch_file(requests: list, path: str) -> str:
+    with open(path, "w", encoding="utf-8") as handle:
+        for request in requests:
+            handle.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return path
+
+
+def state_path(batch_id: str) -> str:
+    return os.path.join(BATCH_STATE_DIR, f"{batch_id}.json")
+
+
+def save_batch_state(batch_id: str, kind: str, metrics: list, sheet: str, trimmed: dict) -> None:
+    """
+    Remember what a submitted batch contains (including the sheet_fingerprint of the sheet it
+    was built from and the tokens trimmed from each request) so its results can be mapped back
+    after a restart.
+    """
+    os.makedirs(BATCH_STATE_DIR, exist_ok=True)
+    with open(state_path(batch_id), "w", encoding="utf-8") as handle:
+        json.dump({"batch_id": batch_id, "kind": kind, "metrics": metrics, "sheet": sheet, "trimmed": trimmed,
+                   "submitted_at": time.time()}, handle)
+
+
+def load_batch_state(batch_id: str) -> Optional[dict]:
+    if not os.path.exists(state_path(batch_id)):
+        return None
+    with open(state_path(batch_id), encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def submit_batch(client, df: pd.DataFrame, metrics: list, kind: str) -> str:
+    """
+    Write the batch input file, upload it and create the batch job. Returns the batch id.
+    """
+    os.makedirs(BATCH_STATE_DIR, exist_ok=True)
+    requests, trimmed = build_batch_requests(df, metrics, kind)
+    input_path = write_batch_file(requests, os.path.join(BATCH_STATE_DIR, f"input-{uuid.uuid4().hex}.jsonl"))
+    with open(input_path, "rb") as handle:
+        input_file = client.files.create(file=handle, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                  completion_window=COMPLETION_WINDOW)
+    save_batch_state(batch.id, kind, metrics, sheet_fingerprint(df), trimmed)
+    return batch.id
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                   timeout: Optional[float] = None, on_status: Optional[Callable] = None):
+    """
+    Poll the batch until it reaches a terminal status or the timeout elapses, and return it.
+    """
+    started = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if on_status is not None:
+            on_status(batch)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - started >= timeout:
+            return batch
+        time.sleep(poll_interval)
+
+
+def batch_errors(batch) -> str:
+    """
+    The error messages of a failed batch (e.g. an invalid input file), joined into one line.
+    """
+    errors = getattr(getattr(batch, "errors", None), "data", None) or []
+    return "; ".join(getattr(error, "message", None) or str(error) for error in errors) or "No error details returned."
+
+
+def _read_jsonl(client, file_id: Optional[str]) -> list:
+    if not file_id:
+        return []
+    return [json.loads(line) for line in client.files.content(file_id).text.splitlines() if line.strip()]
+
+
+def fetch_batch_outputs(client, batch) -> tuple:
+    """
+    Download a finished batch. Returns ({custom_id: response content}, {custom_id: error message}).
+    """
+    contents, errors = {}, {}
+    for line in _read_jsonl(client, batch.output_file_id) + _read_jsonl(client, getattr(batch, "error_file_id", None)):
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code", 200) != 200:
+            errors[line["custom_id"]] = json.dumps(line.get("error") or response.get("body"))
+        else:
+            contents[line["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return contents, errors
+
+
+def check_batch_sheet(state: dict, df: pd.DataFrame, kind: str) -> None:
+    """
+    Raise ValueError if a saved batch was not built from this sheet, so its grades are never
+    attached to the wrong rows.
+    """
+    if state["kind"] != kind:
+        raise ValueError("This batch was submitted for a different file format.")
+    if state.get("sheet") is not None and state["sheet"] != sheet_fingerprint(df):
+        raise ValueError("This batch was submitted for a different sheet. Upload the file it was built from.")
+
+
+def collect_batch_results(df: pd.DataFrame, metrics: list, kind: str, contents: dict, errors: dict,
+                          trimmed: Optional[dict] = None) -> list:
+    """
+    Map batch outputs back into the per-(row, metric) result rows used by the interactive paths.
+    trimmed is the {custom_id: tokens} map saved when the batch was built.
+    """
+    trimmed = trimmed or {}
+    results = []
+    for metric in metrics:
+        for position, (_, row) in enumerate(df.iterrows()):
+            key = custom_id(position, row, metric["name"])
+            try:
+                if key not in contents:
+                    raise RuntimeError(errors.get(key, "No response returned by the batch."))
+                result = result_from_response(row, metric, kind, contents[key].strip())
+            except Exception as e:
+                result = error_result(row, metric, kind, e)
+            results.append({**result, "Trimmed Tokens": trimmed.get(key, 0)})
+    return results
+
+
+def record_batch_results(client, batch, df: pd.DataFrame, state: dict, kind: str, manifest=None,
+                         run_key: Optional[str] = None) -> list:
+    """
+    Download a batch that reached a final status other than "failed", map its outputs back to
+    result rows and record them in the run manifest. Pairs without a response are recorded as
+    failed, so a restart re-grades only those.
+    """
+    contents, errors = fetch_batch_outputs(client, batch)
+    results = collect_batch_results(df, state["metrics"], kind, contents, errors, state.get("trimmed"))
+    fingerprints = {metric["name"]: metric_fingerprint(metric, kind) for metric in state["metrics"]}
+    for result in results:
+        record_result(manifest, run_key, result, fingerprints[result["Metric"]])
+    return results
+
+
+def batch_client(backend, metrics: list, kind: str, local_client=None):
+    """
+    The OpenAI client of a BackendRouter when every metric is judged by an OpenAI model. Other
+    judges have no Batch API, so their batches run in-process through local_client (by default a
+    new LocalBatchClient over the router) and complete on submission.
+    """
+    default = backend.backends[backend.default]
+    if all(backend.resolve(metric_model(metric, kind))[0] is default for metric in metrics):
+        return default.client
+    return local_client or LocalBatchClient(backend.create)
+
+
+class LocalBatchClient:
+    """
+    In-process stand-in for the Files and Batches endpoints. Batches are executed immediately
+    with create_fn (same signature as chat.completions.create), so batch mode can be exercised
+    without network access or batch pricing.
+    """
+
+    def __init__(self, create_fn: Callable):
+        self.create_fn = create_fn
+        self.stored_files = {}
+        self.stored_batches = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self.stored_batches.__getitem__)
+
+    def _store(self, text: str) -> SimpleNamespace:
+        stored = SimpleNamespace(id=f"file-{uuid.uuid4().hex}", text=text)
+        self.stored_files[stored.id] = stored
+        return stored
+
+    def _create_file(self, file, purpose: str) -> SimpleNamespace:
+        data = file.read() if hasattr(file, "read") else file
+        return self._store(data.decode("utf-8") if isinstance(data, bytes) else data)
+
+    def _file_content(self, file_id: str) -> SimpleNamespace:
+        return self.stored_files[file_id]
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> SimpleNamespace:
+        output, failed = io.StringIO(), io.StringIO()
+        for line in self.stored_files[input_file_id].text.splitlines():
+            request = json.loads(line)
+            try:
+                response = self.create_fn(**request["body"])
+                body = {"choices": [{"message": {"content": response.choices[0].message.content}}]}
+                output.write(json.dumps({"custom_id": request["custom_id"],
+                                         "response": {"status_code": 200, "body": body}, "error": None}) + "\n")
+            except Exception as e:
+                failed.write(json.dumps({"custom_id": request["custom_id"], "response": None,
+                                         "error": {"message": str(e)}}) + "\n")
+        batch = SimpleNamespace(id=f"batch-{uuid.uuid4().hex}", status="completed",
+                                output_file_id=self._store(output.getvalue()).id,
+                                error_file_id=self._store(failed.getvalue()).id)
+        self.stored_batches[batch.id] = batch
+        return batch
@@ -0,0 +1,288 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from backends import MOCK_LIMITS, BackendRouter, HTTPBackend, mock_reply
+from duplicates import DEDUPE_MODES
+from evaluation import cached_completion, default_system_prompt, result_error, run_evaluation
+from grading import DEFAULT_CONCURRENCY
+from response_cache import ResponseCache
+from scheduler import RequestScheduler, estimate_prompt_tokens
+
+DEFAULT_ROWS = [100, 1_000, 10_000, 100_000]
+DEFAULT_OUTPUT = "benchmark.json"
+PERCENTILES = [50, 95, 99]
+
+_WORDS = ("the agent customer order refund account policy shipping delivery payment invoice product "
+          "support ticket issue request answer question context reference update status").split()
+
+
+class MockServerState:
+    """
+    Behaviour and request counters of the mock OpenAI-compatible server.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counts = {"requests": 0, "rate_limited": 0, "server_errors": 0,
+                           "prompt_tokens": 0, "completion_tokens": 0}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    def draw(self) -> str:
+        """
+        Decide how the next request is answered: "ok", "rate_limited" or "server_error".
+        """
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return "rate_limited"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["server_errors"] += 1
+                return "server_error"
+            return "ok"
+
+    def count_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self.lock:
+            self.counts["prompt_tokens"] += prompt_tokens
+            self.counts["completion_tokens"] += completion_tokens
+
+
+def mock_handler(state: MockServerState):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+        # Headers and body go out as separate writes; without TCP_NODELAY, Nagle's algorithm and the
+        # client's delayed ACK add ~40 ms to every response
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(state.latency)
+            outcome = state.draw()
+            if outcome == "rate_limited":
+                return self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                  {"Retry-After": "1"})
+            if outcome == "server_error":
+                return self.reply(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+
+            params = {key: value for key, value in body.items() if key not in ("model", "messages")}
+            content = mock_reply(body["model"], body["messages"], params)
+            prompt_tokens = estimate_prompt_tokens(body["messages"], body["model"])
+            completion_tokens = max(len(content) // 4, 1)
+            state.count_tokens(prompt_tokens, completion_tokens)
+            self.reply(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def reply(self, status: int, payload: dict, headers: dict = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockHandler
+
+
+class MockServer:
+    """
+    Local OpenAI-compatible /v1/chat/completions server answering with deterministic grades
+    after latency seconds, failing an error_rate share of requests with 500s and a
+    rate_limit_rate share with 429s.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.state = MockServerState(latency, error_rate, rate_limit_rate, seed)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), mock_handler(self.state))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self) -> "MockServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def synthetic_sheet(kind: str, rows: int, duplicate_rate: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    """
+    A sheet of the given format with rows of realistic length. A duplicate_rate share of the rows
+    repeat an earlier row's content (under a new Index), which the response cache can serve.
+    """
+    rng = random.Random(seed)
+    records = []
+    for index in range(rows):
+        if records and rng.random() < duplicate_rate:
+            records.append({**rng.choice(records), "Index": index})
+        elif kind == "metric":
+            records.append({
+                "Index": index,
+                "Question": synthetic_text(rng, rng.randint(8, 30)),
+                "Context": synthetic_text(rng, rng.randint(100, 400)),
+                "Answer": synthetic_text(rng, rng.randint(20, 120)),
+                "Reference Context": synthetic_text(rng, rng.randint(50, 200)),
+                "Reference Answer": synthetic_text(rng, rng.randint(20, 80)),
+            })
+        else:
+            turns = [f"{'User' if turn % 2 == 0 else 'Agent'}: {synthetic_text(rng, rng.randint(10, 60))}"
+                     for turn in range(rng.randint(4, 30))]
+            records.append({"Index": index, "Conversation": "\n".join(turns),
+                            "Agent Prompt": synthetic_text(rng, rng.randint(30, 120))})
+    return pd.DataFrame(records)
+
+
+def benchmark_metrics(kind: str, count: int, structured: bool = False) -> list:
+    columns = [["Question", "Answer"], ["Question", "Context", "Answer"]] if kind == "metric" else [["Conversation"]]
+    # Each metric gets its own prompt, so cache hits only come from duplicated rows
+    return [{"name": f"Metric {position + 1}",
+             "system_prompt": f"{default_system_prompt(kind, position)}\n(Benchmark metric {position + 1})",
+             "columns": columns[position % len(columns)], "structured": structured} for position in range(count)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case: dict) -> dict:
+    """
+    Grade one synthetic sheet against the mock server. Runs in a fresh process, so the peak
+    RSS it reports belongs to this case alone.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        backend = BackendRouter({"http": HTTPBackend(case["url"], limits=MOCK_LIMITS)}, default="http")
+        scheduler = RequestScheduler(backend=backend)
+        cache = ResponseCache(os.path.join(directory, "responses.sqlite3")) if case["cache"] else None
+        cached = cached_completion(scheduler, cache)
+        latencies = []
+
+        def complete(model: str, messages: list, **params) -> str:
+            start = time.perf_counter()
+            try:
+                return cached(model, messages, **params)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        df = synthetic_sheet(case["kind"], case["rows"], case["duplicate_rate"], case["seed"])
+        metrics = benchmark_metrics(case["kind"], case["metrics"], case["structured"])
+        start = time.perf_counter()
+        results = run_evaluation(df, metrics, complete, fused=case["fused"], max_concurrency=case["concurrency"],
+                                 dedupe=case["dedupe"])
+        elapsed = time.perf_counter() - start
+        backend.close()
+
+        stats = cache.stats() if cache is not None else {"hits": 0, "misses": 0}
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(case["rows"] / elapsed, 2),
+            "results": len(results),
+            "failed": sum(result_error(result) is not None for result in results),
+            "inferred": sum(pd.notna(result.get("Inferred From")) for result in results),
+            "retries": scheduler.retries,
+            **{f"latency_p{p}_ms": round(float(np.percentile(latencies, p)) * 1000, 2) for p in PERCENTILES},
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "cache_hits": stats["hits"],
+            "cache_misses": stats["misses"],
+            "cache_hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the grading pipeline against a local mock judge server.")
+    parser.add_argument("--kinds", nargs="+", default=["metric", "conversation"], choices=["metric", "conversation"])
+    parser.add_argument("--rows", nargs="+", type=int, default=DEFAULT_ROWS, help="Synthetic sheet sizes")
+    parser.add_argument("--metrics", type=int, default=2, help="Metrics graded per sheet")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--fused", action="store_true", help="Grade all metrics for a row in one request")
+    parser.add_argument("--structured", action="store_true", help="Request JSON grades")
+    parser.add_argument("--no-cache", action="store_true", help="Run without the response cache")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default=None, help="Skip grading duplicate rows")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Share of rows repeating an earlier row")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency per request, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON report path")
+    args = parser.parse_args(argv)
+
+    report = {"revision": git_revision(), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "config": {key: value for key, value in vars(args).items() if key != "output"}, "cases": []}
+    context = multiprocessing.get_context("spawn")
+    with MockServer(args.latency, args.error_rate, args.rate_limit_rate, args.seed) as server:
+        for kind in args.kinds:
+            for rows in args.rows:
+                case = {"url": server.url, "kind": kind, "rows": rows, "metrics": args.metrics,
+                        "concurrency": args.concurrency, "fused": args.fused, "structured": args.structured,
+                        "cache": not args.no_cache, "dedupe": args.dedupe, "duplicate_rate": args.duplicate_rate,
+                        "seed": args.seed}
+                server.state.reset()
+                with context.Pool(1) as pool:
+                    measured = pool.apply(run_case, (case,))
+                result = {"kind": kind, "rows": rows, **measured, "server": server.state.snapshot()}
+                report["cases"].append(result)
+                print(f"{kind:>12} {rows:>7} rows: {result['rows_per_sec']:>9.1f} rows/s, "
+                      f"p50 {result['latency_p50_ms']:.0f} ms, p99 {result['latency_p99_ms']:.0f} ms, "
+                      f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['server']['prompt_tokens']} prompt tokens, "
+                      f"cache hit rate {result['cache_hit_rate']:.0%}", file=sys.stderr, flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
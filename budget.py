@@ -0,0 +1,154 @@
+import re
+from typing import Optional
+
+from scheduler import CHARS_PER_TOKEN, count_tokens, encoding_for
+
+# Maximum tokens each field may occupy in a grading request, per judge model. gpt-4's budgets
+# keep the whole request (plus the reply) inside its 8k context window.
+COLUMN_TOKEN_BUDGETS = {
+    "gpt-4": {
+        "System Prompt": 600,
+        "Conversation": 4_000,
+        "Agent Prompt": 1_000,
+        "Question": 500,
+        "Answer": 1_000,
+        "Context": 1_500,
+        "Reference Context": 1_000,
+        "Reference Answer": 500,
+    },
+    "gpt-4o-mini": {
+        "System Prompt": 2_000,
+        "Conversation": 24_000,
+        "Agent Prompt": 4_000,
+        "Question": 2_000,
+        "Answer": 6_000,
+        "Context": 12_000,
+        "Reference Context": 8_000,
+        "Reference Answer": 4_000,
+    },
+}
+COLUMN_TOKEN_BUDGETS["gpt-4o"] = COLUMN_TOKEN_BUDGETS["gpt-4o-mini"]  # Same 128k context window
+DEFAULT_BUDGET_MODEL = "gpt-4"  # Models without their own budgets get the most conservative ones
+
+# Budgets of the judge backends that route "<backend>:<model>" names, filled in by register_backend_budgets
+BACKEND_TOKEN_BUDGETS = {}
+
+KEEP_HEAD_TURNS = 2  # Opening turns always kept when a conversation has to be compacted
+HEAD_SHARE = 2 / 3  # Share of a plain-text budget spent on the beginning of the text
+
+_TURN_START = re.compile(r"^(?=[ \t]*(?:user|agent|assistant|customer|human|ai|bot|system)[ \t]*:)", re.I | re.M)
+
+
+def register_backend_budgets(backend: str, budgets: Optional[dict] = None) -> None:
+    """
+    Resolve "<backend>:<model>" names to budgets (per field, over the default model's), or to
+    the routed model's own budgets when the backend sets none.
+    """
+    BACKEND_TOKEN_BUDGETS[backend] = budgets
+
+
+def model_budgets(model: str) -> dict:
+    """
+    Token budget of every field for the model, resolving routed "<backend>:<model>" names first.
+    """
+    prefix, _, name = model.partition(":")
+    if name and prefix in BACKEND_TOKEN_BUDGETS:
+        if BACKEND_TOKEN_BUDGETS[prefix] is not None:
+            return {**COLUMN_TOKEN_BUDGETS[DEFAULT_BUDGET_MODEL], **BACKEND_TOKEN_BUDGETS[prefix]}
+        model = name
+    return COLUMN_TOKEN_BUDGETS.get(model, COLUMN_TOKEN_BUDGETS[DEFAULT_BUDGET_MODEL])
+
+
+def column_budget(model: str, column: str):
+    """
+    Token budget for a field sent to the model, or None if the field is not budgeted.
+    """
+    return model_budgets(model).get(column)
+
+
+def _head_tail(text: str, budget: int, model: str) -> str:
+    """
+    Keep the beginning and end of text within budget tokens, marking the dropped middle.
+    """
+    head_budget = int(budget * HEAD_SHARE)
+    tail_budget = budget - head_budget
+    encoding = encoding_for(model)
+    if encoding is None:
+        head = text[:head_budget * CHARS_PER_TOKEN]
+        tail = text[-tail_budget * CHARS_PER_TOKEN:] if tail_budget else ""
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_budget])
+        tail = encoding.decode(tokens[-tail_budget:]) if tail_budget else ""
+    return f"{head}\n[... truncated to fit the token budget ...]\n{tail}"
+
+
+def split_turns(text: str) -> list:
+    """
+    Split a transcript into turns at "User:"/"Agent:"-style speaker labels, or into lines if it has none.
+    """
+    turns = [turn for turn in _TURN_START.split(text) if turn.strip()]
+    if len(turns) <= 1:
+        turns = [line for line in text.splitlines(keepends=True) if line.strip()]
+    return turns
+
+
+def compact_conversation(text: str, budget: int, model: str) -> str:
+    """
+    Fit a transcript into budget tokens by keeping its opening turns and as many of its final
+    turns as fit, replacing the middle with a note of how many turns were omitted.
+    """
+    turns = split_turns(text)
+    costs = [count_tokens(turn, model) for turn in turns]
+    marker_cost = 20
+
+    head = []
+    used = marker_cost
+    for turn, cost in zip(turns[:KEEP_HEAD_TURNS], costs[:KEEP_HEAD_TURNS]):
+        if used + cost > budget / 2:
+            break
+        head.append(turn)
+        used += cost
+
+    tail = []
+    for turn, cost in zip(reversed(turns[len(head):]), reversed(costs[len(head):])):
+        if used + cost > budget:
+            break
+        tail.insert(0, turn)
+        used += cost
+
+    if not tail:
+        # A single turn is larger than the budget; fall back to cutting plain text
+        return _head_tail(text, budget, model)
+
+    omitted = len(turns) - len(head) - len(tail)
+    middle = f"[... {omitted} turns omitted to fit the token budget ...]\n" if omitted else ""
+    return "".join(head) + ("\n" if head and not head[-1].endswith("\n") else "") + middle + "".join(tail)
+
+
+def compact_text(text, column: str, model: str) -> tuple:
+    """
+    Fit one field into its token budget for the model. Returns (text, tokens trimmed).
+    """
+    budget = column_budget(model, column)
+    if budget is None or not isinstance(text, str):
+        return text, 0
+    tokens = count_tokens(text, model)
+    if tokens <= budget:
+        return text, 0
+
+    compacted = compact_conversation(text, budget, model) if column == "Conversation" else _head_tail(text, budget, model)
+    return compacted, max(tokens - count_tokens(compacted, model), 0)
+
+
+def compact_row(row, columns: list, model: str) -> tuple:
+    """
+    Compact every budgeted column of a row. Returns (row copy, total tokens trimmed).
+    """
+    compacted_row = row.copy()
+    trimmed = 0
+    for column in columns:
+        if column in compacted_row:
+            compacted_row[column], column_trimmed = compact_text(compacted_row[column], column, model)
+            trimmed += column_trimmed
+    return compacted_row, trimmed
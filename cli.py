@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+from typing import Optional
+
+import pandas as pd
+
+from analytics import score_summary
+from backends import build_router
+from batch_mode import (DEFAULT_POLL_INTERVAL, PARTIAL_STATUSES, TERMINAL_STATUSES, batch_client, batch_errors,
+                        check_batch_sheet, load_batch_state, record_batch_results, submit_batch, wait_for_batch)
+from duplicates import DEDUPE_MODES
+from evaluation import RESULT_COLUMNS, cached_completion, default_system_prompt, detect_kind, validate_columns
+from grading import DEFAULT_CONCURRENCY
+from parsing import parse_failures
+from response_cache import DEFAULT_CACHE_PATH, ResponseCache
+from run_manifest import DEFAULT_MANIFEST_PATH, FAILED, RunManifest
+from scheduler import RequestScheduler, configured_limits
+from streaming import (DEFAULT_CHUNK_SIZE, ResultJournal, export_results, iter_sheet_chunks, make_run_key,
+                       run_streaming_evaluation)
+from telemetry import Telemetry, serve_prometheus, telemetry_labels
+
+
+def load_metrics_config(path: str, kind: str) -> dict:
+    """
+    Read a metrics config file of the form
+
+        {"fused": false, "max_concurrency": 8, "structured": false, "dedupe": "exact",
+         "metrics": [{"name": "Relevance", "columns": ["Question", "Answer"],
+                      "system_prompt": "...", "model": "gpt-4o-mini", "structured": true}]}
+
+    A metric without a system_prompt gets the generated prompt the app would offer, and
+    a metric without a model uses the default judge model for the sheet format. Models are
+    routed by backends.BackendRouter ("mock:judge", "http:<model>", or an OpenAI model). The
+    top-level "structured" is the default for metrics that do not set their own, and
+    "dedupe" ("exact" or "near") skips grading duplicate rows.
+    """
+    with open(path, encoding="utf-8") as handle:
+        config = json.load(handle)
+
+    metrics = []
+    for position, metric in enumerate(config["metrics"]):
+        metrics.append({
+            **metric,
+            "name": metric.get("name") or f"Metric {position + 1}",
+            "columns": metric.get("columns", []),
+            "system_prompt": metric.get("system_prompt") or default_system_prompt(kind, position),
+            "structured": metric.get("structured", config.get("structured", False)),
+        })
+    return {**config, "metrics": metrics}
+
+
+def print_progress(progress: dict) -> None:
+    print(f"Committed chunk {progress['chunks']}: {progress['rows']} rows, {progress['results']} results",
+          file=sys.stderr, flush=True)
+
+
+def run_batch(args, client, kind: str, metrics: list, manifest, run_key: str, journal_path: str) -> Optional[dict]:
+    """
+    Submit the sheet as one batch job (or resume args.batch_id), wait for it to finish and commit
+    its results to the journal. Returns the journal progress, or None if the batch produced no results.
+    """
+    df = pd.concat(iter_sheet_chunks(args.input, chunk_size=args.chunk_size), ignore_index=True)
+    validate_columns(df, kind)
+    batch_id = args.batch_id
+    if batch_id is None:
+        batch_id = submit_batch(client, df, metrics, kind)
+        print(f"Submitted batch {batch_id}; collect it later with --batch-id {batch_id}", file=sys.stderr, flush=True)
+    state = load_batch_state(batch_id) or {"kind": kind, "metrics": metrics}
+    check_batch_sheet(state, df, kind)
+
+    batch = wait_for_batch(client, batch_id, args.poll_interval, args.batch_timeout,
+                           lambda batch: print(f"Batch {batch_id} is {batch.status}", file=sys.stderr, flush=True))
+    if batch.status not in TERMINAL_STATUSES:
+        print(f"Gave up waiting; collect it later with --batch-id {batch_id}", file=sys.stderr)
+        return None
+    if batch.status == "failed":
+        print(f"Batch {batch_id} failed: {batch_errors(batch)}", file=sys.stderr)
+        return None
+    if batch.status in PARTIAL_STATUSES:
+        print(f"Batch {batch_id} {batch.status} before every request finished; rows without a response are "
+              "recorded as failed", file=sys.stderr)
+
+    results = record_batch_results(client, batch, df, state, kind, manifest, run_key)
+    # The batch is committed as one chunk, replacing anything an interrupted collection left behind
+    ResultJournal(journal_path, run_key, RESULT_COLUMNS[kind], args.chunk_size).discard()
+    journal = ResultJournal(journal_path, run_key, RESULT_COLUMNS[kind], args.chunk_size)
+    journal.commit(results, len(df))
+    return journal.progress
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Grade an evaluation sheet with LLM judges, without Streamlit.")
+    parser.add_argument("input", help="Input .xlsx or .csv file")
+    parser.add_argument("--metrics", required=True, help="Metrics config JSON (columns, system prompt, model)")
+    parser.add_argument("--output", required=True, help="Output file (.csv, .xlsx or .parquet)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent grading requests")
+    parser.add_argument("--fused", action="store_true", help="Grade all metrics for a row in a single request")
+    parser.add_argument("--model", default=None,
+                        help="Judge model for every metric, e.g. gpt-4o-mini, http:<model> (JUDGE_BASE_URL) or mock:judge")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default=None,
+                        help="Grade one row per group of exact or near-duplicate rows and copy its result to the others")
+    parser.add_argument("--structured", action="store_true",
+                        help="Request JSON grades with a numeric 0-10 score for every metric")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Response cache path")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the judge model")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows graded and committed at a time")
+    parser.add_argument("--restart", action="store_true",
+                        help="Re-run every chunk, reusing pairs already done in the run manifest and retrying failures")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH, help="Run manifest path")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve request telemetry in Prometheus format on this port while grading")
+    parser.add_argument("--batch", action="store_true",
+                        help="Grade through the OpenAI Batch API: submit one job, wait for it and write its results "
+                             "(--fused and --dedupe do not apply)")
+    parser.add_argument("--batch-id", default=None,
+                        help="Wait for and collect an earlier batch instead of submitting one")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between batch status checks")
+    parser.add_argument("--batch-timeout", type=float, default=None,
+                        help="Stop waiting for the batch after this many seconds")
+    args = parser.parse_args(argv)
+
+    kind = detect_kind(next(iter_sheet_chunks(args.input, chunk_size=1)))
+    if kind is None:
+        parser.error("Unrecognised file format. Expected Question/Context/Answer or Conversation/Agent Prompt columns.")
+    config = load_metrics_config(args.metrics, kind)
+    if args.structured:
+        config["metrics"] = [{**metric, "structured": True} for metric in config["metrics"]]
+    if args.model:
+        config["metrics"] = [{**metric, "model": args.model} for metric in config["metrics"]]
+
+    fused = args.fused or config.get("fused", False)
+    dedupe = args.dedupe or config.get("dedupe")
+    journal_path = f"{args.output}.partial.csv"
+    input_stat = os.stat(args.input)
+    run_key = make_run_key(os.path.abspath(args.input), input_stat.st_size, input_stat.st_mtime, config["metrics"], fused,
+                           dedupe)
+    if args.restart and os.path.exists(f"{journal_path}.progress.json"):
+        os.remove(f"{journal_path}.progress.json")
+
+    cache = None if args.no_cache else ResponseCache(args.cache)
+    backend = build_router(os.environ)
+    telemetry = Telemetry()
+    if args.metrics_port:
+        serve_prometheus(telemetry, args.metrics_port)
+    scheduler = RequestScheduler(backend=backend, limits=configured_limits(os.environ), on_retry=telemetry.record_retry,
+                                 track=telemetry.track)
+    complete = cached_completion(scheduler, cache, telemetry)
+    manifest = RunManifest(args.manifest)
+    with telemetry_labels(run=run_key):
+        if args.batch or args.batch_id:
+            # Batch results share the run's manifest entries, so a later --restart re-grades only what the batch missed
+            progress = run_batch(args, batch_client(backend, config["metrics"], kind), kind, config["metrics"],
+                                 manifest, run_key, journal_path)
+        else:
+            progress = run_streaming_evaluation(
+                args.input, None, config["metrics"], complete, journal_path, run_key,
+                chunk_size=args.chunk_size, fused=fused,
+                max_concurrency=args.concurrency or config.get("max_concurrency", DEFAULT_CONCURRENCY),
+                on_chunk=print_progress, manifest=manifest, dedupe=dedupe,
+            )
+    if progress is None:
+        backend.close()
+        return 1
+    backend.close()
+    export_results(journal_path, args.output, args.chunk_size)
+    graded = pd.read_csv(journal_path, usecols=["Index", "Metric", "Score", "Inferred From"])
+    print(score_summary(graded).to_string(float_format="{:.2f}".format), file=sys.stderr)
+    if graded["Inferred From"].notna().any():
+        print(f"{graded['Inferred From'].notna().sum()} results were inferred from duplicate rows", file=sys.stderr)
+    requests = pd.DataFrame.from_dict(telemetry.rollup("metric", run_key), orient="index")
+    if not requests.empty:
+        print(requests[["requests", "cached", "errors", "retries", "prompt_tokens", "completion_tokens", "cost",
+                        "p50_seconds", "p95_seconds", "mean_queue_seconds"]].to_string(float_format="{:.4f}".format), file=sys.stderr)
+    if os.path.abspath(journal_path) != os.path.abspath(args.output):
+        os.remove(journal_path)
+    os.remove(f"{journal_path}.progress.json")
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses", file=sys.stderr)
+    for metric_name, counts in parse_failures.stats(run_key).items():
+        print(f"{metric_name}: {counts['failures']} unparseable responses, "
+              f"{counts['fallbacks']} recovered by the free-text parser", file=sys.stderr)
+    failed = manifest.summary(run_key)[FAILED]
+    if failed:
+        print(f"{failed} pairs failed; run again with --restart to retry only those", file=sys.stderr)
+    print(f"Wrote {progress['results']} results to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+from typing import Optional
+
+import numpy as np
+
+DEDUPE_MODES = ["exact", "near"]
+
+NEAR_DUPLICATE_THRESHOLD = 0.9  # Minimum estimated Jaccard similarity of every column
+SHINGLE_SIZE = 5  # Characters per shingle
+NUM_PERM = 64  # MinHash signature length
+BANDS = 16  # LSH bands of NUM_PERM // BANDS hashes each
+
+_MIX_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(value) -> str:
+    """
+    Form of a cell value that ignores case, Unicode compatibility variants and whitespace differences.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).casefold()
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def row_signature(row, columns: list) -> str:
+    """
+    Hash of the normalized values of the given columns; rows with equal signatures are exact duplicates.
+    """
+    payload = "\x1f".join(normalize_text(row.get(column)) for column in columns)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles. Each of the num_perm hash functions mixes the
+    shingle's CRC32 with its own random seed through the splitmix64 finalizer.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        generator = np.random.RandomState(seed)
+        self.seeds = generator.randint(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def signature(self, text: str) -> np.ndarray:
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        mixed = self.seeds[:, None] ^ hashes[None, :]
+        with np.errstate(over="ignore"):
+            for multiplier, shift in zip(_MIX_MULTIPLIERS, (30, 27)):
+                mixed = (mixed ^ (mixed >> np.uint64(shift))) * multiplier
+        return (mixed ^ (mixed >> np.uint64(31))).min(axis=1)
+
+
+class _DisjointSet:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            # The earlier row stays the representative
+            self.parent[max(first, second)] = min(first, second)
+
+
+def near_duplicate_clusters(texts: list, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                            bands: int = BANDS, hasher: Optional[MinHasher] = None) -> list:
+    """
+    Cluster items whose every column is nearly identical. texts holds one tuple of normalized
+    column values per item. Candidates come from an in-memory LSH index (an item and a candidate
+    share a bucket when one band of every column's signature matches) and are kept when the
+    estimated Jaccard similarity of each column is at least threshold.
+
+    Returns the cluster id (the position of its first item) for every item.
+    """
+    hasher = hasher or MinHasher()
+    rows_per_band = len(hasher.seeds) // bands
+    signatures = [[hasher.signature(value) for value in columns] for columns in texts]
+    clusters = _DisjointSet(len(texts))
+
+    index = {}
+    for position, columns in enumerate(signatures):
+        for band in range(bands):
+            window = slice(band * rows_per_band, (band + 1) * rows_per_band)
+            key = (band, b"".join(signature[window].tobytes() for signature in columns))
+            anchor = index.setdefault(key, position)
+            if anchor == position or clusters.find(anchor) == clusters.find(position):
+                continue
+            similar = all(np.mean(mine == theirs) >= threshold for mine, theirs in zip(columns, signatures[anchor]))
+            if similar:
+                clusters.union(anchor, position)
+    return [clusters.find(position) for position in range(len(texts))]
+
+
+def duplicate_groups(rows: list, columns: list, mode: Optional[str] = None,
+                     threshold: float = NEAR_DUPLICATE_THRESHOLD) -> list:
+    """
+    Group rows (pd.Series or dicts) whose values in columns are duplicates, as lists of positions
+    in input order; the first position of each group is its representative.
+
+    mode None keeps every row on its own, "exact" groups rows whose normalized values are equal
+    and "near" also merges near-duplicates found by MinHash.
+    """
+    if mode is None:
+        return [[position] for position in range(len(rows))]
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"Unknown duplicate detection mode {mode!r}; expected one of {', '.join(DEDUPE_MODES)}.")
+
+    exact = {}
+    for position, row in enumerate(rows):
+        exact.setdefault(row_signature(row, columns), []).append(position)
+    groups = list(exact.values())
+
+    if mode == "near" and len(groups) > 1:
+        texts = [tuple(normalize_text(rows[group[0]].get(column)) for column in columns) for group in groups]
+        merged = {}
+        for group, cluster in zip(groups, near_duplicate_clusters(texts, threshold)):
+            merged.setdefault(cluster, []).extend(group)
+        groups = [sorted(group) for group in merged.values()]
+
+    return sorted(groups, key=lambda group: group[0])
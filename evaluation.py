@@ -0,0 +1,586 @@
+import hashlib
+import json
+import time
+from typing import Callable, Optional
+
+import pandas as pd
+
+from budget import column_budget, compact_row, compact_text
+from duplicates import duplicate_groups
+from fused import build_fused_prompt, fused_grade_schema, split_fused_json, split_fused_response
+from grading import DEFAULT_CONCURRENCY, grade_concurrently
+from parsing import (CONVERSATION_RESPONSE_FORMAT, METRIC_RESPONSE_FORMAT, NOT_AVAILABLE, STRUCTURED_RESPONSE_FORMAT,
+                     grade_response_format, parse_conversation_response, parse_failures, parse_metric_response,
+                     parse_structured_response, validate_grade)
+from telemetry import current_run, telemetry_labels
+
+# Question/Context/Answer metrics
+METRIC_COLUMNS = ["Index", "Question", "Context", "Answer", "Reference Context", "Reference Answer"]
+METRIC_MODEL = "gpt-4o-mini"
+METRIC_EVALUATOR_MESSAGE = "You are an evaluator analyzing the provided data."
+
+# Agentic conversation metrics
+CONVERSATION_COLUMNS = ["Index", "Conversation", "Agent Prompt"]
+CONVERSATION_MODEL = "gpt-4"
+CONVERSATION_EVALUATOR_MESSAGE = "You are an evaluator analyzing agent conversations."
+
+KIND_COLUMNS = {"metric": METRIC_COLUMNS, "conversation": CONVERSATION_COLUMNS}
+KIND_MODELS = {"metric": METRIC_MODEL, "conversation": CONVERSATION_MODEL}
+
+# Models that accept a json_schema response_format; other models are asked for JSON in the prompt only
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o",)
+
+# Columns of the result rows produced for each sheet format
+RESULT_COLUMNS = {
+    "metric": ["Index", "Metric", "Selected Columns", "Score", "Criteria", "Supporting Evidence",
+               "Question", "Context", "Answer", "Reference Context", "Reference Answer", "Trimmed Tokens",
+               "Inferred From", "Error"],
+    "conversation": ["Index", "Metric", "Selected Columns", "Score", "Criteria", "Supporting Evidence",
+                     "Agent Prompt", "Conversation", "Trimmed Tokens", "Inferred From"],
+}
+
+RELEVANCE_PROMPT = """You are a RELEVANCE grader; providing the relevance of the given question to the given answer.
+Respond only as a number from 0 to 10 where 0 is the least relevant and 10 is the most relevant.
+
+A few additional scoring guidelines:
+- Long answer should score equally well as short answer.
+- RELEVANCE score should increase as the answer provides more RELEVANT context to the question.
+- RELEVANCE score should increase as the answer provides RELEVANT context to more parts of the question.
+- Answer that is RELEVANT to some of the question should score of 2, 3, or 4. Higher score indicates more RELEVANCE.
+- Answer that is RELEVANT to most of the question should get a score of 5, 6, 7, or 8. Higher score indicates more RELEVANCE.
+- Answer that is RELEVANT to the entire question should get a score of 9 or 10. Higher score indicates more RELEVANCE.
+- Answer must be relevant and helpful for answering the entire question to get a score of 10.
+- Never elaborate."""
+
+FACTUAL_ACCURACY_PROMPT = """You are a FACTUAL ACCURACY grader; evaluating the factual correctness of the given answer based on the question and context.
+Respond only as a number from 0 to 10 where 0 indicates completely factually inaccurate and 10 indicates completely factually accurate.
+
+A few additional scoring guidelines:
+- Long answers should score equally well as short answers if they are factually accurate.
+- The FACTUAL ACCURACY score should increase as the answer contains more factually correct information related to the question and context.
+- The presence of minor factual inaccuracies should lead to scores of 2, 3, or 4. Higher scores indicate fewer inaccuracies.
+- If most parts of the answers are factually correct, the score should be 5, 6, 7, or 8. Higher scores indicate greater factual accuracy.
+- If the entire answer is factually accurate and aligned with the question and context, the score should be 9 or 10.
+- The answer must strictly avoid fabrications or contradictions to achieve a score of 10.
+- Never elaborate."""
+
+AGENT_GOAL_ACCURACY_PROMPT = """Role: You are responsible for evaluating the AGENT-GOAL ACCURACY of a conversation based on its alignment with the AGENT PROMPT.
+
+Scoring Scale (0-10):
+0 indicates the responses are entirely unrelated to the AGENT PROMPT.
+1 to 4 reflects limited alignment, lacking depth, precision, or relevance. Scores of 1 to 2 represent negligible coverage with minimal helpfulness, while 3 to 4 indicate partial coverage with insufficient detail or completeness.
+5 to 8 represents reasonable alignment with clear and relevant responses. Scores of 5 to 6 cover most of the prompt but have significant gaps, while 7 to 8 reflect strong alignment with minor omissions or gaps.
+9 to 10 signifies comprehensive alignment with precise, complete, and entirely relevant responses. A score of 9 is near-perfect with minimal imperfections, and a score of 10 is fully sufficient and flawlessly aligned.
+
+Criteria for evaluation include how well the agent responses address user inputs and the AGENT PROMPT, the accuracy, relevance, and helpfulness of the responses, and the completeness and precision in meeting the context of the AGENT PROMPT.
+
+Supporting evidence should highlight areas of strong alignment and fulfillment of goals while identifying specific faults, such as misunderstanding, inaccuracy, or incompleteness, that detract from the relevance or helpfulness of the responses.
+
+Output must be a single numerical score between 0 and 10 with no additional text.
+"""
+
+
+def default_system_prompt(kind: str, position: int) -> str:
+    """
+    Generated system prompt for the metric at the given (0-based) position.
+    Question/Context/Answer metrics alternate between relevance and factual accuracy.
+    """
+    if kind == "conversation":
+        return AGENT_GOAL_ACCURACY_PROMPT
+    return RELEVANCE_PROMPT if position % 2 == 0 else FACTUAL_ACCURACY_PROMPT
+
+
+def load_sheet(source, name: Optional[str] = None) -> pd.DataFrame:
+    """
+    Read an uploaded or on-disk .xlsx/.csv file into a DataFrame.
+    """
+    name = name or str(source)
+    if name.endswith(".xlsx"):
+        return pd.read_excel(source)
+    return pd.read_csv(source)
+
+
+def detect_kind(df: pd.DataFrame) -> Optional[str]:
+    """
+    Return "metric" for Question/Context/Answer sheets, "conversation" for agentic sheets,
+    or None if the columns match neither format.
+    """
+    if "Question" in df.columns and "Context" in df.columns and "Answer" in df.columns:
+        return "metric"
+    if "Conversation" in df.columns and "Agent Prompt" in df.columns:
+        return "conversation"
+    return None
+
+
+def validate_columns(df: pd.DataFrame, kind: str) -> None:
+    required_columns = KIND_COLUMNS[kind]
+    if not all(col in df.columns for col in required_columns):
+        raise ValueError(f"The uploaded file must contain these columns: {', '.join(required_columns)}.")
+    validate_index(df)
+
+
+def validate_index(df: pd.DataFrame, seen: Optional[set] = None) -> None:
+    """
+    Raise ValueError if an Index value repeats within the sheet (or one of the keys in seen),
+    since results, the run manifest and the stored analytics are all keyed on it.
+    """
+    keys = df["Index"].astype(str)
+    repeated = keys[keys.duplicated() | keys.isin(seen or ())].unique()
+    if len(repeated):
+        raise ValueError(f"Every row needs a unique Index; repeated values: {', '.join(repeated[:5])}.")
+
+
+def metric_model(metric: dict, kind: str) -> str:
+    return metric.get("model") or KIND_MODELS[kind]
+
+
+def structured_params(model: str, schema_name: str = "grade", schema: Optional[dict] = None) -> dict:
+    """
+    Extra request parameters asking the model for a reply matching the grade schema, if it supports them.
+    """
+    if not model.startswith(STRUCTURED_OUTPUT_MODELS):
+        return {}
+    return {"response_format": grade_response_format(schema_name, schema)}
+
+
+def request_params(metric: dict, kind: str) -> dict:
+    if not metric.get("structured"):
+        return {}
+    return structured_params(metric_model(metric, kind))
+
+
+def system_prompt_budget_exceeded(metric: dict, kind: str) -> Optional[int]:
+    """
+    Return the system prompt's token budget for the metric's judge model if the prompt exceeds it.
+    """
+    model = metric_model(metric, kind)
+    _, trimmed = compact_text(metric["system_prompt"], "System Prompt", model)
+    return column_budget(model, "System Prompt") if trimmed else None
+
+
+def metric_data_block(row: pd.Series, selected_columns: list) -> str:
+    return "".join(f"{col}: {row[col]}\n" for col in selected_columns)
+
+
+def conversation_data_block(row: pd.Series) -> str:
+    return f"Index: {row['Index']}\nConversation: {row['Conversation']}\nAgent Prompt: {row['Agent Prompt']}"
+
+
+def build_metric_prompt(system_prompt: str, row: pd.Series, selected_columns: list, structured: bool = False) -> str:
+    """
+    Construct the evaluation prompt for a Question/Context/Answer metric from the system prompt
+    and the selected column values.
+    """
+    if structured:
+        response_format, closing = STRUCTURED_RESPONSE_FORMAT, "Respond with the JSON object only."
+    else:
+        response_format, closing = METRIC_RESPONSE_FORMAT, "Ensure the response strictly follows this format with numbered headings."
+    return f"""
+{system_prompt}
+
+Below is the data for evaluation:
+{metric_data_block(row, selected_columns)}
+
+Based on the provided data, evaluate the following in this exact format:
+{response_format}
+
+{closing}
+"""
+
+
+def build_conversation_prompt(system_prompt: str, row: pd.Series, structured: bool = False) -> str:
+    """
+    Construct the evaluation prompt for an agentic conversation metric.
+    """
+    return f"""
+System Prompt: {system_prompt}
+
+{conversation_data_block(row)}
+
+Evaluate the entire conversation for Agent-Goal Accuracy. Use the following format:
+
+{STRUCTURED_RESPONSE_FORMAT if structured else CONVERSATION_RESPONSE_FORMAT}
+"""
+
+
+def source_columns(metrics: list, kind: str) -> list:
+    """
+    Sheet columns whose text is sent to the judge for the given metrics.
+    """
+    if kind == "conversation":
+        return ["Conversation", "Agent Prompt"]
+    return [col for col in METRIC_COLUMNS[1:] if any(col in metric["columns"] for metric in metrics)]
+
+
+def build_prompt(row: pd.Series, metric: dict, kind: str) -> tuple:
+    """
+    Construct the evaluation prompt for (row, metric), compacting the system prompt and every
+    column to the judge model's token budgets. Returns (prompt, tokens trimmed).
+    """
+    model = metric_model(metric, kind)
+    system_prompt, trimmed = compact_text(metric["system_prompt"], "System Prompt", model)
+    row, row_trimmed = compact_row(row, source_columns([metric], kind), model)
+    structured = bool(metric.get("structured"))
+    if kind == "metric":
+        return build_metric_prompt(system_prompt, row, metric["columns"], structured), trimmed + row_trimmed
+    return build_conversation_prompt(system_prompt, row, structured), trimmed + row_trimmed
+
+
+def build_messages(evaluation_prompt: str, kind: str) -> list:
+    evaluator_message = METRIC_EVALUATOR_MESSAGE if kind == "metric" else CONVERSATION_EVALUATOR_MESSAGE
+    return [
+        {"role": "system", "content": evaluator_message},
+        {"role": "user", "content": evaluation_prompt}
+    ]
+
+
+def metric_result(row: pd.Series, metric_name: str, selected_columns: list, parsed: dict) -> dict:
+    return {
+        "Index": row["Index"],
+        "Metric": metric_name,
+        "Selected Columns": ", ".join(selected_columns),
+        "Score": parsed["Score"],
+        "Criteria": parsed["Criteria"],
+        "Supporting Evidence": parsed["Supporting Evidence"],
+        "Question": row["Question"],
+        "Context": row["Context"],
+        "Answer": row["Answer"],
+        "Reference Context": row["Reference Context"],
+        "Reference Answer": row["Reference Answer"]
+    }
+
+
+def metric_error(row: pd.Series, metric_name: str, selected_columns: list, error: Exception) -> dict:
+    error_parsed = {"Score": "Error", "Criteria": "Error", "Supporting Evidence": "Error"}
+    return {**metric_result(row, metric_name, selected_columns, error_parsed), "Error": str(error)}
+
+
+def conversation_result(row: pd.Series, metric_name: str, selected_columns: list, parsed: dict) -> dict:
+    return {
+        "Index": row["Index"],
+        "Metric": metric_name,
+        "Selected Columns": ", ".join(selected_columns),
+        "Score": parsed["Score"],
+        "Criteria": parsed["Criteria"],
+        "Supporting Evidence": parsed["Supporting Evidence"],
+        "Agent Prompt": row.get("Agent Prompt", ""),
+        "Conversation": row.get("Conversation", "")
+    }
+
+
+def conversation_error(row: pd.Series, metric_name: str, selected_columns: list, error: Exception) -> dict:
+    return conversation_result(row, metric_name, selected_columns, {
+        "Score": "N/A",
+        "Criteria": "Error",
+        "Supporting Evidence": f"Error processing conversation: {error}"
+    })
+
+
+def result_error(result: dict) -> Optional[str]:
+    """
+    Return the error message of a failed result row, or None if the row was graded.
+    A reply the parser could not read (any field "Not available") counts as failed, so it is re-graded.
+    """
+    if result.get("Criteria") == "Error":
+        return result.get("Error") or result.get("Supporting Evidence") or "Error"
+    if NOT_AVAILABLE in (result.get("Score"), result.get("Criteria"), result.get("Supporting Evidence")):
+        return "The grader's reply could not be parsed"
+    return None
+
+
+def row_key(row) -> str:
+    return str(row["Index"])
+
+
+def metric_fingerprint(metric: dict, kind: str) -> str:
+    """
+    Hash of everything that affects a metric's grading, used to tell whether a stored result is still valid.
+    """
+    payload = json.dumps({"kind": kind, "model": metric_model(metric, kind), "system_prompt": metric["system_prompt"],
+                          "columns": metric["columns"], "structured": bool(metric.get("structured"))}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_grade(metric: dict, kind: str, response) -> dict:
+    """
+    Parse a grader reply into Score/Criteria/Supporting Evidence.
+
+    Structured metrics are decoded and validated against the grade schema in one step; a reply
+    that fails validation falls back to the free-text parser for the sheet format. response may
+    also be an already decoded grade object (from a fused structured reply). Replies that cannot
+    be parsed are counted per run and metric in parse_failures.
+    """
+    if metric.get("structured"):
+        try:
+            return parse_structured_response(response) if isinstance(response, str) else validate_grade(response)
+        except ValueError:
+            if not isinstance(response, str):
+                parse_failures.record_failure(current_run(), metric["name"])
+                raise
+
+    try:
+        parsed = parse_metric_response(response) if kind == "metric" else parse_conversation_response(response)
+    except ValueError:
+        parse_failures.record_failure(current_run(), metric["name"])
+        raise
+    if NOT_AVAILABLE in parsed.values():
+        parse_failures.record_failure(current_run(), metric["name"])
+    elif metric.get("structured"):
+        parse_failures.record_fallback(current_run(), metric["name"])
+    return parsed
+
+
+def result_from_response(row: pd.Series, metric: dict, kind: str, response_content) -> dict:
+    """
+    Parse a grader reply into the result row for (row, metric). Raises ValueError if an
+    agentic reply is missing any of its fields.
+    """
+    if kind == "metric":
+        return metric_result(row, metric["name"], metric["columns"], parse_grade(metric, kind, response_content))
+    return conversation_result(row, metric["name"], metric["columns"], parse_grade(metric, kind, response_content))
+
+
+def error_result(row: pd.Series, metric: dict, kind: str, error: Exception) -> dict:
+    if kind == "metric":
+        return metric_error(row, metric["name"], metric["columns"], error)
+    return conversation_error(row, metric["name"], metric["columns"], error)
+
+
+def cached_completion(scheduler, cache=None, telemetry=None) -> Callable[..., str]:
+    """
+    Build the complete(model, messages, refresh=False, **params) -> str function used by the graders:
+    requests go through the rate-limited scheduler, and repeated prompts are served from the response
+    cache. refresh=True skips the cache lookup (the new reply still replaces the stored one), so
+    re-grading a failed pair does not get back the reply it failed on. With telemetry, every
+    completion's latency (of the judge call itself), queue time, token usage and cost is recorded.
+    """
+    def complete(model: str, messages: list, refresh: bool = False, **params) -> str:
+        start = time.perf_counter()
+        key = cache.key(model, messages, params) if cache is not None else None
+        content = cache.get(key) if cache is not None and not refresh else None
+        if content is not None:
+            if telemetry is not None:
+                telemetry.record_request(model, time.perf_counter() - start, cached=True)
+            return content
+
+        timings = {"call_seconds": 0.0, "queue_seconds": 0.0}
+        try:
+            response = scheduler.create(model=model, messages=messages, timings=timings, **params)
+        except Exception as e:
+            if telemetry is not None:
+                telemetry.record_request(model, timings["call_seconds"], error=e, prompt=messages[-1]["content"],
+                                         queued=timings["queue_seconds"])
+            raise
+        if telemetry is not None:
+            telemetry.record_request(model, timings["call_seconds"], getattr(response, "usage", None),
+                                     prompt=messages[-1]["content"], queued=timings["queue_seconds"])
+        content = response.choices[0].message.content
+        if cache is not None:
+            cache.put(key, content)
+        return content
+
+    return complete
+
+
+def grade_row(complete: Callable, row: pd.Series, metric: dict, kind: str, refresh: bool = False) -> dict:
+    """
+    Grade one row against one metric. Errors are recorded in the result row instead of raised.
+    refresh bypasses the response cache.
+    """
+    trimmed = 0
+    try:
+        evaluation_prompt, trimmed = build_prompt(row, metric, kind)
+        with telemetry_labels(metric=metric["name"]):
+            response_content = complete(model=metric_model(metric, kind), messages=build_messages(evaluation_prompt, kind),
+                                        refresh=refresh, **request_params(metric, kind))
+        result = result_from_response(row, metric, kind, response_content.strip())
+    except Exception as e:
+        result = error_result(row, metric, kind, e)
+    return {**result, "Trimmed Tokens": trimmed}
+
+
+def grade_row_fused(complete: Callable, row: pd.Series, metrics: list, kind: str, refresh: bool = False) -> list:
+    """
+    Grade one row against every metric with one request per judge model.
+
+    A model's metrics are graded with structured output when every one of them asks for it.
+    """
+    models = list(dict.fromkeys(metric_model(metric, kind) for metric in metrics))
+    results = {}
+    for model in models:
+        group = []
+        trimmed = 0
+        for metric in metrics:
+            if metric_model(metric, kind) == model:
+                system_prompt, prompt_trimmed = compact_text(metric["system_prompt"], "System Prompt", model)
+                group.append({**metric, "system_prompt": system_prompt})
+                trimmed += prompt_trimmed
+        compacted_row, row_trimmed = compact_row(row, source_columns(group, kind), model)
+        trimmed += row_trimmed
+        if kind == "metric":
+            data_block = metric_data_block(compacted_row, source_columns(group, kind))
+        else:
+            data_block = conversation_data_block(compacted_row)
+
+        names = [metric["name"] for metric in group]
+        structured = all(metric.get("structured") for metric in group)
+        if structured:
+            response_format, params = STRUCTURED_RESPONSE_FORMAT, structured_params(model, "grades", fused_grade_schema(names))
+        else:
+            response_format, params = METRIC_RESPONSE_FORMAT if kind == "metric" else CONVERSATION_RESPONSE_FORMAT, {}
+            group = [{**metric, "structured": False} for metric in group]
+
+        try:
+            evaluation_prompt = build_fused_prompt(group, data_block, response_format, structured,
+                                                   list_columns=kind == "metric")
+            # Fused requests are attributed to all of their metrics together
+            with telemetry_labels(metric=" + ".join(names)):
+                response_content = complete(model=model, messages=build_messages(evaluation_prompt, kind),
+                                            refresh=refresh, **params).strip()
+            sections = None
+            if structured:
+                try:
+                    sections = split_fused_json(response_content, names)
+                except ValueError:
+                    pass  # Not JSON; the free-text sections go through the fallback parser
+            if sections is None:
+                sections = split_fused_response(response_content, names)
+        except Exception as e:
+            results.update({metric["name"]: {**error_result(row, metric, kind, e), "Trimmed Tokens": trimmed}
+                            for metric in group})
+            continue
+
+        for metric in group:
+            try:
+                result = result_from_response(row, metric, kind, sections.get(metric["name"], ""))
+            except Exception as e:
+                result = error_result(row, metric, kind, e)
+            results[metric["name"]] = {**result, "Trimmed Tokens": trimmed}
+
+    return [results[metric["name"]] for metric in metrics]
+
+
+def inferred_result(result: dict, row: pd.Series, kind: str) -> dict:
+    """
+    Copy a representative row's result to a duplicate row, recording which Index it was inferred from.
+    """
+    row_values = {col: row[col] for col in KIND_COLUMNS[kind] if col in row}
+    return {**result, **row_values, "Inferred From": result["Index"]}
+
+
+def grade_deduplicated(rows: list, columns: list, dedupe: Optional[str], grade_fn: Callable,
+                       infer_fn: Callable, max_concurrency: int, on_progress: Optional[Callable]) -> list:
+    """
+    Grade one representative row per group of duplicates (see duplicates.duplicate_groups) and
+    build the other rows' results with infer_fn(representative result, row). Returns the
+    results in the order of rows.
+    """
+    groups = duplicate_groups(rows, columns, dedupe)
+    graded = grade_concurrently([rows[group[0]] for group in groups], grade_fn, max_concurrency, on_progress)
+    results = [None] * len(rows)
+    for group, result in zip(groups, graded):
+        results[group[0]] = result
+        for position in group[1:]:
+            results[position] = infer_fn(result, rows[position])
+    return results
+
+
+def record_result(manifest, run_key: str, result: dict, fingerprint: str) -> dict:
+    if manifest is not None:
+        manifest.record(run_key, row_key(result), result, fingerprint, result_error(result))
+    return result
+
+
+def evaluate_metric(df: pd.DataFrame, metric: dict, kind: str, complete: Callable,
+                    max_concurrency: int = DEFAULT_CONCURRENCY, on_progress: Optional[Callable] = None,
+                    manifest=None, run_key: Optional[str] = None, dedupe: Optional[str] = None) -> list:
+    """
+    Grade every row of the sheet against one metric. Rows are graded concurrently and
+    returned in input order.
+
+    With a run manifest, rows already graded for this metric in the same run are reused
+    instead of re-graded, rows that failed are re-graded without the response cache, and
+    every new result is recorded as done or failed. With dedupe
+    ("exact" or "near"), rows whose metric columns duplicate an earlier row's get that row's
+    result, marked with the Index it was inferred from, instead of their own request.
+    """
+    validate_index(df)
+    rows = [row for _, row in df.iterrows()]
+    fingerprint = metric_fingerprint(metric, kind)
+    done, failed = {}, set()
+    if manifest is not None:
+        done = manifest.done_results(run_key, metric["name"], fingerprint)
+        failed = manifest.failed_keys(run_key, metric["name"], fingerprint)
+    pending = [row for row in rows if row_key(row) not in done]
+    if manifest is not None:
+        manifest.mark_pending(run_key, [row_key(row) for row in pending], metric["name"], fingerprint)
+
+    graded = iter(grade_deduplicated(
+        pending, source_columns([metric], kind), dedupe,
+        lambda row: record_result(manifest, run_key,
+                                  grade_row(complete, row, metric, kind, row_key(row) in failed), fingerprint),
+        lambda result, row: record_result(manifest, run_key, inferred_result(result, row, kind), fingerprint),
+        max_concurrency, on_progress
+    ))
+    return [done[row_key(row)] if row_key(row) in done else next(graded) for row in rows]
+
+
+def evaluate_fused(df: pd.DataFrame, metrics: list, kind: str, complete: Callable,
+                   max_concurrency: int = DEFAULT_CONCURRENCY, on_progress: Optional[Callable] = None,
+                   manifest=None, run_key: Optional[str] = None, dedupe: Optional[str] = None) -> list:
+    """
+    Grade every row against all metrics in a single request per row (per judge model).
+    Returns one result per (row, metric), grouped by row in input order.
+
+    With a run manifest, only the metrics a row has not completed yet are sent for grading,
+    bypassing the response cache when any of them failed before.
+    With dedupe, rows duplicating an earlier row in every metric's columns reuse its results.
+    """
+    validate_index(df)
+    rows = [row for _, row in df.iterrows()]
+    fingerprints = {metric["name"]: metric_fingerprint(metric, kind) for metric in metrics}
+    done, failed = {}, set()
+    if manifest is not None:
+        for metric in metrics:
+            fingerprint = fingerprints[metric["name"]]
+            done[metric["name"]] = manifest.done_results(run_key, metric["name"], fingerprint)
+            failed |= manifest.failed_keys(run_key, metric["name"], fingerprint)
+            manifest.mark_pending(run_key, [row_key(row) for row in rows if row_key(row) not in done[metric["name"]]],
+                                  metric["name"], fingerprint)
+
+    def grade(row: pd.Series) -> list:
+        missing = [metric for metric in metrics if row_key(row) not in done.get(metric["name"], {})]
+        graded = {result["Metric"]: record_result(manifest, run_key, result, fingerprints[result["Metric"]])
+                  for result in (grade_row_fused(complete, row, missing, kind, row_key(row) in failed)
+                                 if missing else [])}
+        return [graded.get(metric["name"]) or done[metric["name"]][row_key(row)] for metric in metrics]
+
+    def infer(row_results: list, row: pd.Series) -> list:
+        missing = {metric["name"] for metric in metrics if row_key(row) not in done.get(metric["name"], {})}
+        return [record_result(manifest, run_key, inferred_result(result, row, kind), fingerprints[result["Metric"]])
+                if result["Metric"] in missing else done[result["Metric"]][row_key(row)] for result in row_results]
+
+    per_row_results = grade_deduplicated(rows, source_columns(metrics, kind), dedupe, grade, infer,
+                                         max_concurrency, on_progress)
+    return [result for row_results in per_row_results for result in row_results]
+
+
+def run_evaluation(df: pd.DataFrame, metrics: list, complete: Callable, fused: bool = False,
+                   max_concurrency: int = DEFAULT_CONCURRENCY, on_progress: Optional[Callable] = None,
+                   manifest=None, run_key: Optional[str] = None, dedupe: Optional[str] = None) -> list:
+    """
+    Validate the sheet and grade it against every metric, returning the combined result rows.
+    """
+    kind = detect_kind(df)
+    if kind is None:
+        raise ValueError("Unrecognised file format. Expected Question/Context/Answer or Conversation/Agent Prompt columns.")
+    validate_columns(df, kind)
+
+    if fused and len(metrics) > 1:
+        return evaluate_fused(df, metrics, kind, complete, max_concurrency, on_progress, manifest, run_key, dedupe)
+
+    results = []
+    for metric in metrics:
+        results.extend(evaluate_metric(df, metric, kind, complete, max_concurrency, on_progress, manifest, run_key,
+                                       dedupe))
+    return results
@@ -0,0 +1,93 @@
+import re
+
+from parsing import GRADE_SCHEMA, decode_json
+
+_HEADING = re.compile(r"^[ \t]*#{1,6}[ \t]*\**[ \t]*(.+?)[ \t]*\**[ \t]*:?[ \t]*$", re.M)
+
+
+def fused_grade_schema(metric_names: list) -> dict:
+    """
+    JSON schema of a fused structured reply: one GRADE_SCHEMA object per metric name.
+    """
+    return {"type": "object", "properties": {name: GRADE_SCHEMA for name in metric_names},
+            "required": list(metric_names), "additionalProperties": False}
+
+
+def build_fused_prompt(metrics: list, data_block: str, response_format: str, structured: bool = False,
+                       list_columns: bool = False) -> str:
+    """
+    Build one evaluation prompt that grades the same data against every metric.
+
+    metrics is a list of {"name": ..., "system_prompt": ..., "columns": [...]} dicts. The grader
+    is asked to answer each metric under a "### <name>" heading using response_format, so the
+    reply can be split back into one block per metric with split_fused_response. With structured,
+    it is asked instead for one JSON object keyed by metric name (see split_fused_json).
+
+    The data block holds the columns of every metric, so with list_columns (Question/Context/Answer
+    sheets) each heading also names the columns its metric is graded on, as its own prompt would show.
+    """
+    def section(metric: dict) -> str:
+        heading = f"### {metric['name']}\n"
+        if list_columns:
+            heading += f"Grade this metric on these columns only: {', '.join(metric['columns'])}\n"
+        return heading + metric["system_prompt"].strip()
+
+    instructions = "\n\n".join(section(metric) for metric in metrics)
+    names = ", ".join(metric["name"] for metric in metrics)
+    scope = "instructions and columns" if list_columns else "instructions"
+
+    if structured:
+        return f"""
+You are grading the same data against {len(metrics)} separate metrics. The grading instructions for each metric follow its heading:
+
+{instructions}
+
+Below is the data for evaluation:
+{data_block}
+
+Evaluate every metric ({names}) independently, using only that metric's {scope}.
+Respond with a single JSON object with one key per metric name ({names}), each holding:
+{response_format}
+"""
+
+    return f"""
+You are grading the same data against {len(metrics)} separate metrics. The grading instructions for each metric follow its heading:
+
+{instructions}
+
+Below is the data for evaluation:
+{data_block}
+
+Evaluate every metric ({names}) independently, using only that metric's {scope}.
+Start the section for each metric with its heading line (for example "### {metrics[0]['name']}") and follow it with this exact format:
+{response_format}
+
+Ensure the response contains one section per metric and strictly follows this format.
+"""
+
+
+def split_fused_response(response_content: str, metric_names: list) -> dict:
+    """
+    Split a fused reply into {metric name: response block}. Metrics whose heading is
+    missing from the reply are left out of the result.
+    """
+    headings = list(_HEADING.finditer(response_content))
+    sections = {}
+    for position, heading in enumerate(headings):
+        name = heading.group(1).strip()
+        if name not in metric_names or name in sections:
+            continue
+        end = headings[position + 1].start() if position + 1 < len(headings) else len(response_content)
+        sections[name] = response_content[heading.end():end].strip()
+    return sections
+
+
+def split_fused_json(response_content: str, metric_names: list) -> dict:
+    """
+    Decode a fused structured reply into {metric name: grade object}. Metrics missing from
+    the reply are left out; raises ValueError if the reply is not a JSON object.
+    """
+    payload = decode_json(response_content)
+    if not isinstance(payload, dict):
+        raise ValueError("Fused structured response is not a JSON object.")
+    return {name: payload[name] for name in metric_names if name in payload}
@@ -0,0 +1,60 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
+
+DEFAULT_CONCURRENCY = 8  # Default number of grading requests kept in flight at once
+MAX_CONCURRENCY = 64
+
+
+def grade_concurrently(
+    items: list,
+    grade_fn: Callable,
+    max_concurrency: int = DEFAULT_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> list:
+    """
+    Run grade_fn over every item on a thread pool and return the results in input order.
+
+    grade_fn is expected to handle its own errors and return a result for every item.
+    on_progress(done, total) is called from the calling thread each time an item finishes,
+    so it is safe to update Streamlit widgets from it; if it raises, rows not started yet are
+    cancelled and the exception propagates without waiting for the rest. grade_fn runs in a
+    copy of the caller's context, so context variables (such as telemetry labels) carry over
+    to the workers.
+    """
+    total = len(items)
+    results = [None] * total
+    if total == 0:
+        return results
+
+    workers = max(1, min(int(max_concurrency), MAX_CONCURRENCY, total))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(contextvars.copy_context().run, grade_fn, item): position
+                   for position, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress is not None:
+                on_progress(done, total)
+    except BaseException:
+        # E.g. Streamlit stopping the script from inside on_progress: drop the queued rows
+        # instead of paying for them, and only leave the requests in flight to finish
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    return results
+
+
+def streamlit_progress(label: str) -> Callable[[int, int], None]:
+    """
+    Create an on_progress callback that drives a Streamlit progress bar.
+    """
+    import streamlit as st
+
+    progress_bar = st.progress(0.0, text=label)
+
+    def update(done: int, total: int) -> None:
+        progress_bar.progress(done / total, text=f"{label} {done}/{total} rows graded")
+
+    return update
@@ -0,0 +1,173 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import Optional, Union
+
+NOT_AVAILABLE = "Not available"
+
+METRIC_RESPONSE_FORMAT = """1. Criteria: [Provide a detailed explanation of how the evaluation is derived.]
+2. Supporting Evidence: [Provide specific examples from the data supporting the evaluation.]
+3. Score: [Provide a numerical or qualitative score.]"""
+
+CONVERSATION_RESPONSE_FORMAT = """Criteria: [Explain how well the Agent responded to the User's input and fulfilled their goals]
+Supporting Evidence: [Highlight specific faulty or insufficient responses from the Agent]
+Score: [Provide a numerical or qualitative score here]"""
+
+STRUCTURED_RESPONSE_FORMAT = """A single JSON object with exactly these keys:
+{"criteria": "<detailed explanation of how the evaluation is derived>",
+ "supporting_evidence": "<specific examples from the data supporting the evaluation>",
+ "score": <number from 0 to 10>}"""
+
+MIN_SCORE = 0
+MAX_SCORE = 10
+
+# JSON schema of one grade, sent as the response_format of structured-output requests
+GRADE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "criteria": {"type": "string"},
+        "supporting_evidence": {"type": "string"},
+        "score": {"type": "number", "description": f"Score from {MIN_SCORE} to {MAX_SCORE}"},
+    },
+    "required": ["criteria", "supporting_evidence", "score"],
+    "additionalProperties": False,
+}
+
+# Field labels of the free-text formats, optionally numbered ("2.") or in bold ("**Score:**")
+_FIELD = re.compile(r"^[ \t]*(?:\d+\.[ \t]*)?(\*\*)?[ \t]*(Criteria|Supporting Evidence|Score)[ \t]*\**[ \t]*:[ \t]*(?(1)\**)[ \t]*",
+                    re.I | re.M)
+_FIELD_NAMES = {"criteria": "Criteria", "supporting evidence": "Supporting Evidence", "score": "Score"}
+_NUMERIC_SCORE = re.compile(r"^\**[ \t]*(-?\d+(?:\.\d+)?)[ \t]*(?:/[ \t]*10|out of 10)?[ \t]*\**\.?$", re.I)
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.S)
+
+
+def grade_response_format(name: str = "grade", schema: Optional[dict] = None) -> dict:
+    """
+    OpenAI response_format requesting a reply that matches the schema (one grade by default).
+    """
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema or GRADE_SCHEMA}}
+
+
+def parse_score(score: str) -> Union[int, float, str]:
+    """
+    Return the score as a number when it is one ("7", "7/10", "**7.5**"), or the text unchanged.
+    """
+    match = _NUMERIC_SCORE.match(score.strip())
+    if match is None:
+        return score
+    value = float(match.group(1))
+    return int(value) if value.is_integer() else value
+
+
+def _split_fields(response_content: str) -> dict:
+    """
+    Map each labelled field to its (possibly multi-line) text, up to the next field label.
+    The first occurrence of a label wins.
+    """
+    labels = list(_FIELD.finditer(response_content))
+    fields = {}
+    for position, label in enumerate(labels):
+        name = _FIELD_NAMES[label.group(2).lower()]
+        end = labels[position + 1].start() if position + 1 < len(labels) else len(response_content)
+        if name not in fields:
+            fields[name] = response_content[label.end():end].strip()
+    if fields.get("Score"):
+        # Anything after the score line is commentary, not part of the score
+        fields["Score"] = parse_score(fields["Score"].splitlines()[0])
+    return fields
+
+
+def parse_metric_response(response_content: str) -> dict:
+    """
+    Parse the numbered "1. Criteria / 2. Supporting Evidence / 3. Score" format used by the
+    Question/Context/Answer metrics. Missing fields are reported as "Not available".
+    """
+    fields = _split_fields(response_content)
+    return {name: fields.get(name) if fields.get(name) not in (None, "") else NOT_AVAILABLE
+            for name in ("Score", "Criteria", "Supporting Evidence")}
+
+
+def parse_conversation_response(response_content: str) -> dict:
+    """
+    Parse the "Criteria: / Supporting Evidence: / Score:" format used by the agentic metrics.
+    Raises ValueError if any of the fields is missing.
+    """
+    fields = _split_fields(response_content)
+    parsed = {name: fields.get(name, "") for name in ("Score", "Criteria", "Supporting Evidence")}
+    if any(value == "" for value in parsed.values()):
+        raise ValueError("Response does not contain the required structured fields.")
+    return parsed
+
+
+def validate_grade(payload) -> dict:
+    """
+    Check a decoded structured grade against GRADE_SCHEMA and convert it to result fields.
+    Raises ValueError if it does not match.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Structured response is not a JSON object.")
+    missing = [key for key in GRADE_SCHEMA["required"] if key not in payload]
+    if missing:
+        raise ValueError(f"Structured response is missing {', '.join(missing)}.")
+    score = payload["score"]
+    if isinstance(score, str):
+        score = parse_score(score)
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not MIN_SCORE <= score <= MAX_SCORE:
+        raise ValueError(f"Structured response score {payload['score']!r} is not a number from {MIN_SCORE} to {MAX_SCORE}.")
+    if not isinstance(payload["criteria"], str) or not isinstance(payload["supporting_evidence"], str):
+        raise ValueError("Structured response criteria and supporting_evidence must be strings.")
+    return {
+        "Score": int(score) if float(score).is_integer() else float(score),
+        "Criteria": payload["criteria"].strip(),
+        "Supporting Evidence": payload["supporting_evidence"].strip(),
+    }
+
+
+def decode_json(response_content: str):
+    """
+    Decode a JSON reply, tolerating a surrounding ```json code fence.
+    """
+    fenced = _JSON_FENCE.match(response_content.strip())
+    return json.loads(fenced.group(1) if fenced else response_content)
+
+
+def parse_structured_response(response_content: str) -> dict:
+    """
+    Decode and validate a structured (JSON) grade. Raises ValueError if it is not valid.
+    """
+    return validate_grade(decode_json(response_content))
+
+
+class ParseFailures:
+    """
+    Per-(run, metric) counts of replies that did not parse.
+
+    "fallbacks" are structured replies that failed validation but were recovered by the
+    free-text parser; "failures" are replies no parser could read.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fallbacks = Counter()
+        self.failures = Counter()
+
+    def record_fallback(self, run_key: str, metric_name: str) -> None:
+        with self.lock:
+            self.fallbacks[(run_key, metric_name)] += 1
+
+    def record_failure(self, run_key: str, metric_name: str) -> None:
+        with self.lock:
+            self.failures[(run_key, metric_name)] += 1
+
+    def stats(self, run_key: str) -> dict:
+        """
+        {metric name: {"fallbacks": n, "failures": n}} for one run.
+        """
+        with self.lock:
+            keys = [key for key in dict.fromkeys([*self.fallbacks, *self.failures]) if key[0] == run_key]
+            return {key[1]: {"fallbacks": self.fallbacks[key], "failures": self.failures[key]} for key in keys}
+
+
+# Process-wide counters, shown per run by the app and the command-line entry point
+parse_failures = ParseFailures()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.environ.get("LLM_EVAL_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_MAX_AGE_DAYS = 30
+EVICT_EVERY = 1_000  # Run eviction after this many writes
+
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache of grader responses stored in SQLite.
+
+    Entries are keyed on a hash of the model, the full message list (system prompt and
+    evaluation prompt) and the sampling parameters, so only changed rows miss the cache.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86_400
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.connection.commit()
+        self.evict()
+
+    @staticmethod
+    def key(model: str, messages: list, params: Optional[dict] = None) -> str:
+        """
+        Hash a request into its cache key.
+        """
+        payload = json.dumps({"model": model, "messages": messages, "params": params or {}},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            self.connection.commit()
+            self.writes += 1
+            evict_now = self.writes % EVICT_EVERY == 0
+        if evict_now:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop entries older than the maximum age, then the least recently used beyond the size limit.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE created_at < ?",
+                                    (time.time() - self.max_age_seconds,))
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.connection.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
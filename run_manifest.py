@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_MANIFEST_PATH = os.environ.get("LLM_EVAL_MANIFEST_PATH", os.path.join(".cache", "manifest.sqlite3"))
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def _json_default(value):
+    # numpy/pandas scalars (e.g. an int64 Index) serialise as their Python value
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class RunManifest:
+    """
+    Per-(Index, Metric) status of evaluation runs, stored in SQLite next to the response cache.
+
+    Every pair is marked pending before it is graded and done or failed (with its error) once
+    its result is recorded. Restarting a run reuses done results whose metric fingerprint still
+    matches, and re-grades only pending and failed pairs (failed ones bypassing the response cache).
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pairs ("
+            "run_key TEXT NOT NULL, row_key TEXT NOT NULL, metric TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+            "status TEXT NOT NULL, error TEXT, result TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (run_key, row_key, metric))"
+        )
+        self.connection.commit()
+
+    def done_results(self, run_key: str, metric_name: str, fingerprint: str) -> dict:
+        """
+        Return {row key: result} for the metric's pairs that completed with the same configuration.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT row_key, result FROM pairs WHERE run_key = ? AND metric = ? AND fingerprint = ? AND status = ?",
+                (run_key, metric_name, fingerprint, DONE),
+            ).fetchall()
+        return {row_key: json.loads(result) for row_key, result in rows}
+
+    def failed_keys(self, run_key: str, metric_name: str, fingerprint: str) -> set:
+        """
+        Return the row keys of the metric's pairs whose last completed attempt with the same configuration failed.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT row_key FROM pairs WHERE run_key = ? AND metric = ? AND fingerprint = ? AND status != ? "
+                "AND error IS NOT NULL",
+                (run_key, metric_name, fingerprint, DONE),
+            ).fetchall()
+        return {row_key for (row_key,) in rows}
+
+    def mark_pending(self, run_key: str, row_keys: list, metric_name: str, fingerprint: str) -> None:
+        """
+        Mark pairs as about to be graded, dropping their stored result. A pair that failed keeps its
+        error, so it is still re-graded without the response cache if this attempt is interrupted.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO pairs (run_key, row_key, metric, fingerprint, status, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_key, row_key, metric) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                "status = excluded.status, result = NULL, updated_at = excluded.updated_at",
+                [(run_key, row_key, metric_name, fingerprint, PENDING, now) for row_key in row_keys],
+            )
+            self.connection.commit()
+
+    def record(self, run_key: str, row_key: str, result: dict, fingerprint: str, error: Optional[str] = None) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO pairs (run_key, row_key, metric, fingerprint, status, error, result, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_key, row_key, metric) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                "status = excluded.status, error = excluded.error, result = excluded.result, updated_at = excluded.updated_at",
+                (run_key, row_key, result["Metric"], fingerprint, FAILED if error else DONE, error,
+                 json.dumps(result, default=_json_default), time.time()),
+            )
+            self.connection.commit()
+
+    def results(self, run_key: str, fingerprints: dict) -> list:
+        """
+        Recorded result of every done or failed pair in the run whose metric is in fingerprints
+        ({metric name: fingerprint}) with the same configuration, in the order they were first added.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT metric, fingerprint, result FROM pairs WHERE run_key = ? AND status IN (?, ?) "
+                "AND result IS NOT NULL ORDER BY rowid", (run_key, DONE, FAILED)
+            ).fetchall()
+        return [json.loads(result) for metric, fingerprint, result in rows if fingerprints.get(metric) == fingerprint]
+
+    def summary(self, run_key: str) -> dict:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM pairs WHERE run_key = ? GROUP BY status", (run_key,)
+            ).fetchall()
+        return {PENDING: 0, DONE: 0, FAILED: 0, **dict(rows)}
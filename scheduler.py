@@ -0,0 +1,217 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Callable, Mapping, Optional
+
+import openai
+import tiktoken
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Requests-per-minute and tokens-per-minute limits for each judge model (OpenAI usage tier 1).
+# Accounts on higher tiers raise them with the RATE_LIMITS setting, see configured_limits.
+MODEL_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-4o": {"rpm": 500, "tpm": 30_000},
+    "gpt-4": {"rpm": 500, "tpm": 10_000},
+}
+DEFAULT_LIMITS = {"rpm": 500, "tpm": 10_000}
+
+EXPECTED_COMPLETION_TOKENS = 400  # Allowance reserved for the grader's reply when budgeting a request
+MAX_ATTEMPTS = 8
+
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+CHARS_PER_TOKEN = 4  # Rough estimate used when the tiktoken encoding files cannot be loaded
+
+
+@lru_cache(maxsize=None)
+def encoding_for(model: str):
+    """
+    Return the tiktoken encoding for a model, or None if its encoding files cannot be loaded.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken downloads its encoding files on first use; fall back to estimating offline
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Count the tokens tiktoken produces for text under the given model's encoding.
+    """
+    encoding = encoding_for(model)
+    if encoding is None:
+        return len(text or "") // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def estimate_prompt_tokens(messages: list, model: str) -> int:
+    """
+    Estimate the prompt tokens of a chat request, including the per-message framing overhead.
+    """
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 3
+
+
+class _Bucket:
+    """
+    Token bucket that refills continuously up to a per-minute capacity.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+
+class RateLimiter:
+    """
+    Blocks callers until a request of the given token size fits within the RPM and TPM limits.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.tokens.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if delay == 0:
+                    self.requests.available -= 1
+                    self.tokens.available -= tokens
+                    return
+            time.sleep(delay)
+
+    def reconcile(self, reserved: int, used: int) -> None:
+        """
+        Return unused headroom (or charge the overrun) once the real token usage is known.
+        reserved is clamped like in acquire, so an oversized request cannot refund more than it took.
+        """
+        reserved = min(reserved, self.tokens.capacity)
+        with self.lock:
+            self.tokens.available = min(self.tokens.capacity, self.tokens.available + reserved - used)
+
+
+def configured_limits(settings: Mapping) -> dict:
+    """
+    Per-model rate limits from the RATE_LIMITS app secret or environment variable: a JSON object
+    (or secrets table) such as {"gpt-4o": {"rpm": 5000, "tpm": 800000}, "http:llama3": {"tpm": 60000}},
+    keyed by the model name as metrics select it. A model may set only rpm or tpm; the other
+    keeps its default.
+    """
+    value = settings.get("RATE_LIMITS")
+    limits = json.loads(value) if isinstance(value, str) else value
+    return {model: dict(model_limits) for model, model_limits in (limits or {}).items()}
+
+
+def _is_transient(error: BaseException) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class RequestScheduler:
+    """
+    Sends chat completion requests through per-model rate limiters, retrying transient
+    failures (429s, timeouts, connection and 5xx errors) with jittered exponential backoff.
+
+    Requests go to create_fn, or to backend.create when a judge backend is given (see
+    backends.py). Rate limits come from limits ({model: {"rpm": ..., "tpm": ...}}, see
+    configured_limits), then the backend, then MODEL_LIMITS; a model in limits may override
+    only one of the two.
+    on_retry(model) is called before every retry, from the thread making the request, and
+    track() (e.g. Telemetry.track) is entered around every call to the judge itself.
+    """
+
+    def __init__(self, create_fn: Optional[Callable] = None, limits: Optional[dict] = None,
+                 max_attempts: int = MAX_ATTEMPTS, backend=None, on_retry: Optional[Callable[[str], None]] = None,
+                 track: Optional[Callable] = None):
+        self.create_fn = create_fn or (backend.create if backend is not None else None)
+        self.backend = backend
+        self.on_retry = on_retry
+        self.track = track or nullcontext
+        self.limits = limits or {}
+        self.max_attempts = max_attempts
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    def limiter_for(self, model: str) -> RateLimiter:
+        with self.lock:
+            if model not in self.limiters:
+                backend_limits = self.backend.limits_for(model) if self.backend is not None else MODEL_LIMITS.get(model)
+                limits = {**(backend_limits or DEFAULT_LIMITS), **self.limits.get(model, {})}
+                self.limiters[model] = RateLimiter(limits["rpm"], limits["tpm"])
+            return self.limiters[model]
+
+    def _count_retry(self, model: str) -> None:
+        with self.lock:
+            self.retries += 1
+        if self.on_retry is not None:
+            self.on_retry(model)
+
+    def create(self, model: str, messages: list, timings: Optional[dict] = None, **params):
+        """
+        Send one chat completion request, waiting for rate-limit headroom before each attempt.
+
+        If a timings dict is given, it receives "call_seconds", the duration of the last call to
+        the judge, and "queue_seconds", the time spent before it waiting for rate-limit headroom,
+        backing off and on failed attempts.
+        """
+        started = time.perf_counter()
+        create_fn = self.create_fn or openai.chat.completions.create
+        limiter = self.limiter_for(model)
+        reserved = estimate_prompt_tokens(messages, model) + params.get("max_tokens", EXPECTED_COMPLETION_TOKENS)
+
+        retrying = Retrying(
+            retry=retry_if_exception(_is_transient),
+            wait=wait_random_exponential(multiplier=1, max=60),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=lambda retry_state: self._count_retry(model),
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                limiter.acquire(reserved)
+                call_started = time.perf_counter()
+                try:
+                    with self.track():
+                        response = create_fn(model=model, messages=messages, **params)
+                except BaseException:
+                    # A failed attempt used no tokens; refund its reservation before the retry takes another
+                    limiter.reconcile(reserved, 0)
+                    raise
+                finally:
+                    if timings is not None:
+                        timings["call_seconds"] = time.perf_counter() - call_started
+                        timings["queue_seconds"] = call_started - started
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            limiter.reconcile(reserved, usage.total_tokens)
+        return response
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from evaluation import RESULT_COLUMNS, detect_kind, run_evaluation, validate_columns, validate_index
+from grading import DEFAULT_CONCURRENCY
+from parsing import NOT_AVAILABLE
+
+DEFAULT_CHUNK_SIZE = 500  # Rows read, graded and committed to disk at a time
+OUTPUT_FORMATS = [".csv", ".xlsx", ".parquet"]
+# Result columns exported as numbers when every value is one; the markers of ungraded rows become nulls
+NUMERIC_COLUMNS = ["Index", "Score", "Trimmed Tokens", "Inferred From"]
+MISSING_MARKERS = {"", "N/A", "Error", NOT_AVAILABLE}
+
+
+def make_run_key(*parts) -> str:
+    """
+    Identify a run by its input and configuration, so progress is only resumed for the same job.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _sheet_frame(rows: list, header: list) -> pd.DataFrame:
+    # openpyxl reads empty cells as None; make them NaN and infer dtypes as pd.read_excel does, so a
+    # row gives the same prompt (and response cache key) whether it is graded streaming or interactively
+    frame = pd.DataFrame(rows, columns=header, dtype=object)
+    return frame.where(frame.notna(), np.nan).infer_objects()
+
+
+def iter_sheet_chunks(source, name: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of an .xlsx/.csv file as DataFrames of at most chunk_size rows, without
+    loading the whole sheet. Excel files are read with openpyxl in read-only mode.
+    """
+    name = name or str(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if not name.endswith(".xlsx"):
+        yield from pd.read_csv(source, chunksize=chunk_size)
+        return
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value) if value is not None else "" for value in next(rows, ())]
+        batch = []
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            batch.append(values[:len(header)])
+            if len(batch) >= chunk_size:
+                yield _sheet_frame(batch, header)
+                batch = []
+        if batch:
+            yield _sheet_frame(batch, header)
+    finally:
+        workbook.close()
+
+
+class ResultJournal:
+    """
+    Append-only CSV of result rows plus a progress file recording the last committed chunk.
+
+    Each chunk's results are flushed to disk before the progress file is updated, and anything
+    written after the last commit is truncated away on reopen, so a crashed run resumes from
+    the last committed chunk without duplicating or losing rows.
+    """
+
+    def __init__(self, path: str, run_key: str, columns: list, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.progress_path = f"{path}.progress.json"
+        self.columns = columns
+
+        progress = self._load_progress()
+        if progress is None or progress["run_key"] != run_key or progress["columns"] != columns:
+            progress = {"run_key": run_key, "columns": columns, "chunk_size": chunk_size,
+                        "chunks": 0, "rows": 0, "results": 0, "offset": 0}
+            if os.path.exists(path):
+                os.remove(path)
+            self._save_progress(progress)
+        elif os.path.exists(path):
+            # Drop a partially written chunk left behind by a crash
+            with open(path, "r+b") as handle:
+                handle.truncate(progress["offset"])
+        self.progress = progress
+
+    @property
+    def chunk_size(self) -> int:
+        return self.progress["chunk_size"]
+
+    @property
+    def committed_chunks(self) -> int:
+        return self.progress["chunks"]
+
+    def _load_progress(self) -> Optional[dict]:
+        if not os.path.exists(self.progress_path):
+            return None
+        with open(self.progress_path, encoding="utf-8") as handle:
+            return json.load(handle)
+
+    def _save_progress(self, progress: dict) -> None:
+        temporary_path = f"{self.progress_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as handle:
+            json.dump(progress, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary_path, self.progress_path)
+
+    def commit(self, results: list, rows: int) -> None:
+        frame = pd.DataFrame(results).reindex(columns=self.columns)
+        with open(self.path, "a", newline="", encoding="utf-8") as handle:
+            frame.to_csv(handle, header=self.progress["offset"] == 0, index=False)
+            handle.flush()
+            os.fsync(handle.fileno())
+        self.progress = {**self.progress, "chunks": self.progress["chunks"] + 1, "rows": self.progress["rows"] + rows,
+                         "results": self.progress["results"] + len(results), "offset": os.path.getsize(self.path)}
+        self._save_progress(self.progress)
+
+    def discard(self) -> None:
+        for path in (self.path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _read_journal(journal_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    return pd.read_csv(journal_path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+
+def journal_dtypes(journal_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Scan the journal for the NUMERIC_COLUMNS that hold only numbers (besides missing markers),
+    and return the dtype each should be exported as. Deciding once for the whole journal keeps
+    every chunk, and so the Parquet schema, consistent; a column with other text (such as
+    qualitative scores) stays text.
+    """
+    integral, text = {}, set()
+    for chunk in _read_journal(journal_path, chunk_size):
+        for column in NUMERIC_COLUMNS:
+            if column not in chunk or column in text:
+                continue
+            numbers = pd.to_numeric(chunk[column][~chunk[column].isin(MISSING_MARKERS)], errors="coerce")
+            if numbers.isna().any():
+                text.add(column)
+            else:
+                integral[column] = integral.get(column, True) and bool((numbers % 1 == 0).all())
+    return {column: "Int64" if is_integral else "Float64" for column, is_integral in integral.items()
+            if column not in text}
+
+
+def typed_chunk(chunk: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Restore the types the journal's CSV text lost: numeric columns as numbers and blanks as nulls.
+    """
+    chunk = chunk.mask(chunk == "")
+    for column, dtype in dtypes.items():
+        chunk[column] = pd.to_numeric(chunk[column].mask(chunk[column].isin(MISSING_MARKERS)),
+                                      errors="coerce").astype(dtype)
+    return chunk
+
+
+def export_results(journal_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    """
+    Convert the result journal to the output format (chosen by extension) chunk by chunk.
+    XLSX and Parquet outputs keep numeric columns numeric (see journal_dtypes).
+    """
+    if output_path.endswith(".xlsx"):
+        import openpyxl
+
+        dtypes = journal_dtypes(journal_path, chunk_size)
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        header_written = False
+        for chunk in _read_journal(journal_path, chunk_size):
+            if not header_written:
+                worksheet.append(list(chunk.columns))
+                header_written = True
+            chunk = typed_chunk(chunk, dtypes).astype(object)
+            for values in chunk.where(chunk.notna(), None).itertuples(index=False):
+                worksheet.append(list(values))
+        workbook.save(output_path)
+    elif output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        dtypes = journal_dtypes(journal_path, chunk_size)
+        arrow_types = {"Int64": pa.int64(), "Float64": pa.float64()}
+        writer = schema = None
+        try:
+            for chunk in _read_journal(journal_path, chunk_size):
+                # Explicit types, since a column can be all null within one chunk
+                schema = schema or pa.schema([(column, arrow_types.get(dtypes.get(column), pa.string()))
+                                              for column in chunk.columns])
+                table = pa.Table.from_pandas(typed_chunk(chunk, dtypes), schema=schema, preserve_index=False)
+                writer = writer or pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif os.path.abspath(journal_path) != os.path.abspath(output_path):
+        shutil.copyfile(journal_path, output_path)
+    return output_path
+
+
+def run_streaming_evaluation(source, name: Optional[str], metrics: list, complete: Callable, journal_path: str,
+                             run_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE, fused: bool = False,
+                             max_concurrency: int = DEFAULT_CONCURRENCY,
+                             on_chunk: Optional[Callable[[dict], None]] = None, manifest=None,
+                             dedupe: Optional[str] = None) -> dict:
+    """
+    Grade a sheet chunk by chunk, appending each chunk's results to the journal as it finishes.
+
+    Chunks already committed by an earlier run with the same run_key are skipped, so only the
+    remaining rows are graded. With a run manifest, pairs already done under the same run_key
+    are reused rather than re-graded. With dedupe, duplicate rows are detected within each
+    chunk. on_chunk(progress) is called after every commit. Returns the final progress record.
+    """
+    journal = None
+    seen = set()  # Index values of earlier chunks, which must not repeat either
+    for position, chunk in enumerate(iter_sheet_chunks(source, name, chunk_size)):
+        if journal is None:
+            kind = detect_kind(chunk)
+            if kind is None:
+                raise ValueError("Unrecognised file format. Expected Question/Context/Answer or Conversation/Agent Prompt columns.")
+            validate_columns(chunk, kind)
+            journal = ResultJournal(journal_path, run_key, RESULT_COLUMNS[kind], chunk_size)
+            if journal.chunk_size != chunk_size:
+                # Resume with the chunk boundaries the interrupted run committed
+                return run_streaming_evaluation(source, name, metrics, complete, journal_path, run_key,
+                                                journal.chunk_size, fused, max_concurrency, on_chunk, manifest, dedupe)
+        validate_index(chunk, seen)
+        seen.update(chunk["Index"].astype(str))
+        if position < journal.committed_chunks:
+            continue
+
+        results = run_evaluation(chunk, metrics, complete, fused=fused, max_concurrency=max_concurrency,
+                                 manifest=manifest, run_key=run_key, dedupe=dedupe)
+        journal.commit(results, len(chunk))
+        if on_chunk is not None:
+            on_chunk(journal.progress)
+
+    return journal.progress if journal is not None else {"chunks": 0, "rows": 0, "results": 0}
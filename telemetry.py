@@ -0,0 +1,256 @@
+import contextvars
+import heapq
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+
+# USD per million prompt/completion tokens; models not listed (e.g. the mock judge) cost nothing
+MODEL_PRICES = {
+    "gpt-4o-mini": {"prompt": 0.15, "completion": 0.60},
+    "gpt-4o": {"prompt": 2.50, "completion": 10.00},
+    "gpt-4": {"prompt": 30.00, "completion": 60.00},
+}
+
+LATENCY_WINDOW = 10_000  # Request latencies kept per metric for percentiles
+MAX_TRACKED_RUNS = 20  # Runs whose per-run breakdown is kept; older runs only count towards the exported totals
+SLOWEST_REQUESTS = 20
+PROMPT_PREVIEW_CHARS = 200
+
+_RUN = contextvars.ContextVar("telemetry_run", default="-")
+_METRIC = contextvars.ContextVar("telemetry_metric", default="-")
+
+
+@contextmanager
+def telemetry_labels(run: Optional[str] = None, metric: Optional[str] = None):
+    """
+    Attribute the requests made inside the block to a run and/or metric. The labels follow
+    the work onto grade_concurrently's worker threads.
+    """
+    tokens = []
+    if run is not None:
+        tokens.append((_RUN, _RUN.set(run)))
+    if metric is not None:
+        tokens.append((_METRIC, _METRIC.set(metric)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def current_run() -> str:
+    """
+    The run the current requests are attributed to by telemetry_labels, "-" outside of one.
+    """
+    return _RUN.get()
+
+
+def request_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1_000_000
+
+
+COUNTERS = ("requests", "cached", "errors", "retries", "prompt_tokens", "completion_tokens", "cost", "seconds",
+            "queue_seconds")
+
+
+def _new_stats() -> dict:
+    return {**dict.fromkeys(COUNTERS, 0), "latencies": deque(maxlen=LATENCY_WINDOW)}
+
+
+class Telemetry:
+    """
+    Thread-safe per-request timing, token and cost counters, rolled up per (run, metric, model).
+
+    cached_completion records every completion through record_request (cache hits included),
+    the request scheduler reports retries through record_retry and wraps each judge call in
+    track(), and snapshot() / prometheus_text() read the totals for the app's telemetry panel
+    and the metrics endpoint. Latency is the judge call alone; time spent waiting for rate-limit
+    headroom and retries is counted separately as queue_seconds. Only the last MAX_TRACKED_RUNS
+    runs keep their breakdown, so a long-lived instance does not grow without bound.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {}
+        self.totals = {}  # Cumulative counters per (metric, model), for the exporter
+        self.runs = OrderedDict()  # Tracked runs, least recently active first
+        self.slowest = []  # min-heap of (seconds, sequence, request details)
+        self.sequence = 0
+
+    def _count(self, model: str, **increments) -> dict:
+        run, metric = _RUN.get(), _METRIC.get()
+        self.runs[run] = None
+        self.runs.move_to_end(run)
+        if len(self.runs) > MAX_TRACKED_RUNS:
+            expired, _ = self.runs.popitem(last=False)
+            self.stats = {key: stats for key, stats in self.stats.items() if key[0] != expired}
+            self.slowest = [entry for entry in self.slowest if entry[2]["run"] != expired]
+            heapq.heapify(self.slowest)
+
+        if (metric, model) not in self.totals:
+            self.totals[(metric, model)] = dict.fromkeys(COUNTERS, 0)
+        stats = self.stats.setdefault((run, metric, model), _new_stats())
+        for field, value in increments.items():
+            stats[field] += value
+            self.totals[(metric, model)][field] += value
+        return stats
+
+    @contextmanager
+    def track(self):
+        """
+        Count a request sent to the judge as in flight for the duration of the block.
+        """
+        with self.lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def record_request(self, model: str, seconds: float, usage=None, cached: bool = False,
+                       error: Optional[BaseException] = None, prompt: str = "", queued: float = 0.0) -> None:
+        """
+        Record a completion that took seconds in the judge call, after queued seconds of waiting.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self.lock:
+            stats = self._count(model, requests=1, cached=int(cached), errors=int(error is not None),
+                                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                cost=request_cost(model, prompt_tokens, completion_tokens), seconds=seconds,
+                                queue_seconds=queued)
+            if not cached:
+                # Cache hits never reach the judge, so they stay out of the latency percentiles
+                stats["latencies"].append(seconds)
+                self.sequence += 1
+                entry = (seconds, self.sequence, {"run": _RUN.get(), "metric": _METRIC.get(), "model": model,
+                                                  "seconds": round(seconds, 3), "queued": round(queued, 3),
+                                                  "prompt_tokens": prompt_tokens,
+                                                  "error": str(error) if error is not None else None,
+                                                  "prompt": prompt[:PROMPT_PREVIEW_CHARS]})
+                if len(self.slowest) < SLOWEST_REQUESTS:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+    def record_retry(self, model: str) -> None:
+        with self.lock:
+            self._count(model, retries=1)
+
+    def _grouped(self, position: Optional[int], run: Optional[str]) -> dict:
+        with self.lock:
+            items = [(key, dict(stats, latencies=list(stats["latencies"]))) for key, stats in self.stats.items()
+                     if run is None or key[0] == run]
+        groups = {}
+        for key, stats in items:
+            groups.setdefault(key[position] if position is not None else None, []).append(stats)
+        return {name: _merge(group) for name, group in groups.items()}
+
+    def rollup(self, by: str = "metric", run: Optional[str] = None) -> dict:
+        """
+        Totals grouped by "run", "metric" or "model", optionally only for one run.
+        """
+        groups = self._grouped({"run": 0, "metric": 1, "model": 2}[by], run)
+        return {name: summarise(stats) for name, stats in groups.items()}
+
+    def snapshot(self, run: Optional[str] = None) -> dict:
+        """
+        Totals (optionally for one run), requests in flight and the slowest requests.
+        """
+        totals = summarise(self._grouped(None, run).get(None, _new_stats()))
+        with self.lock:
+            in_flight = self.in_flight
+            slowest = [entry for _, _, entry in sorted(self.slowest, reverse=True)
+                       if run is None or entry["run"] == run]
+        return {**totals, "in_flight": in_flight, "slowest": slowest}
+
+    def prometheus_text(self) -> str:
+        """
+        The counters in the Prometheus text exposition format, labelled by metric and model.
+        """
+        with self.lock:
+            items = [(key, dict(stats)) for key, stats in self.totals.items()]
+            in_flight = self.in_flight
+        counters = [
+            ("llm_eval_requests_total", "requests", "Completions requested by the graders, including cache hits"),
+            ("llm_eval_cache_hits_total", "cached", "Completions served from the response cache"),
+            ("llm_eval_request_errors_total", "errors", "Completions that failed after all retries"),
+            ("llm_eval_retries_total", "retries", "Retried judge requests"),
+            ("llm_eval_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent to the judge"),
+            ("llm_eval_completion_tokens_total", "completion_tokens", "Completion tokens received from the judge"),
+            ("llm_eval_cost_usd_total", "cost", "Estimated judge spend in USD"),
+            ("llm_eval_request_seconds_total", "seconds", "Total time spent in judge calls"),
+            ("llm_eval_queue_seconds_total", "queue_seconds",
+             "Total time requests waited for rate-limit headroom and retries before their judge call"),
+        ]
+        lines = []
+        for name, field, help_text in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (metric, model), stats in items:
+                labels = f'metric="{_escape(metric)}",model="{_escape(model)}"'
+                lines.append(f"{name}{{{labels}}} {stats[field]}")
+        lines += ["# HELP llm_eval_in_flight_requests Judge requests currently in flight",
+                  "# TYPE llm_eval_in_flight_requests gauge", f"llm_eval_in_flight_requests {in_flight}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _merge(groups) -> dict:
+    merged = _new_stats()
+    merged["latencies"] = deque()
+    for stats in groups:
+        for field in COUNTERS:
+            merged[field] += stats[field]
+        merged["latencies"].extend(stats["latencies"])
+    return merged
+
+
+def summarise(stats: dict) -> dict:
+    """
+    Replace the raw latency window with mean/p50/p95/p99 latency in seconds of the requests sent
+    to the judge (cache hits excluded), and add the mean time such a request spent queued.
+    """
+    latencies = np.asarray(stats["latencies"], dtype=float)
+    summary = {key: value for key, value in stats.items() if key != "latencies"}
+    summary["mean_seconds"] = float(latencies.mean()) if latencies.size else 0.0
+    summary["mean_queue_seconds"] = stats["queue_seconds"] / max(stats["requests"] - stats["cached"], 1)
+    for p in (50, 95, 99):
+        summary[f"p{p}_seconds"] = float(np.percentile(latencies, p)) if latencies.size else 0.0
+    return summary
+
+
+def serve_prometheus(telemetry: Telemetry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve telemetry.prometheus_text() at /metrics on a background thread.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
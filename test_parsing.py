@@ -0,0 +1,98 @@
+import unittest
+
+from parsing import (NOT_AVAILABLE, decode_json, parse_conversation_response, parse_metric_response, parse_score,
+                     parse_structured_response, validate_grade)
+
+
+class MetricResponseTests(unittest.TestCase):
+    def test_numbered_format(self):
+        parsed = parse_metric_response("1. Criteria: Relevant answer.\n2. Supporting Evidence: Cites the context.\n"
+                                       "3. Score: 8")
+        self.assertEqual(parsed, {"Score": 8, "Criteria": "Relevant answer.", "Supporting Evidence": "Cites the context."})
+
+    def test_unnumbered_format(self):
+        parsed = parse_metric_response("Criteria: Relevant answer.\nSupporting Evidence: Cites the context.\nScore: 8")
+        self.assertEqual(parsed["Score"], 8)
+        self.assertEqual(parsed["Supporting Evidence"], "Cites the context.")
+
+    def test_bold_labels(self):
+        parsed = parse_metric_response("1. **Criteria:** Relevant.\n2. **Supporting Evidence**: Quotes.\n"
+                                       "3. **Score:** **7**")
+        self.assertEqual(parsed, {"Score": 7, "Criteria": "Relevant.", "Supporting Evidence": "Quotes."})
+
+    def test_bold_value_keeps_its_markers(self):
+        parsed = parse_metric_response("Criteria: **Mostly** relevant.\nSupporting Evidence: x\nScore: 5")
+        self.assertEqual(parsed["Criteria"], "**Mostly** relevant.")
+
+    def test_multi_line_evidence(self):
+        parsed = parse_metric_response("1. Criteria: Relevant.\n2. Supporting Evidence: First point.\n"
+                                       "- Second point.\n\nThird point.\n3. Score: 6")
+        self.assertEqual(parsed["Supporting Evidence"], "First point.\n- Second point.\n\nThird point.")
+        self.assertEqual(parsed["Score"], 6)
+
+    def test_commentary_after_score_is_dropped(self):
+        parsed = parse_metric_response("Criteria: c\nSupporting Evidence: e\nScore: 9\nOverall a strong answer.")
+        self.assertEqual(parsed["Score"], 9)
+
+    def test_missing_fields_are_not_available(self):
+        parsed = parse_metric_response("The answer looks fine to me.")
+        self.assertEqual(set(parsed.values()), {NOT_AVAILABLE})
+
+    def test_qualitative_score_is_kept(self):
+        self.assertEqual(parse_metric_response("Criteria: c\nSupporting Evidence: e\nScore: High")["Score"], "High")
+
+
+class ConversationResponseTests(unittest.TestCase):
+    def test_baseline_format(self):
+        parsed = parse_conversation_response("Criteria: Helpful.\nSupporting Evidence: Answered the refund question.\n"
+                                             "Score: 9")
+        self.assertEqual(parsed, {"Score": 9, "Criteria": "Helpful.",
+                                  "Supporting Evidence": "Answered the refund question."})
+
+    def test_missing_field_raises(self):
+        with self.assertRaises(ValueError):
+            parse_conversation_response("Criteria: Helpful.\nScore: 9")
+
+
+class ScoreTests(unittest.TestCase):
+    def test_numeric_forms(self):
+        for text, expected in [("7", 7), ("7/10", 7), ("7 / 10", 7), ("7 out of 10", 7), ("**7.5**", 7.5),
+                               ("8.", 8), ("6.0", 6)]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_score(text), expected)
+
+    def test_text_is_returned_unchanged(self):
+        self.assertEqual(parse_score("7 because it is mostly right"), "7 because it is mostly right")
+
+
+class StructuredResponseTests(unittest.TestCase):
+    GRADE = '{"criteria": "Relevant.", "supporting_evidence": "Quotes.", "score": 8}'
+
+    def test_plain_json(self):
+        self.assertEqual(parse_structured_response(self.GRADE),
+                         {"Score": 8, "Criteria": "Relevant.", "Supporting Evidence": "Quotes."})
+
+    def test_fenced_json(self):
+        self.assertEqual(parse_structured_response(f"```json\n{self.GRADE}\n```")["Score"], 8)
+        self.assertEqual(decode_json(f"```\n{self.GRADE}\n```")["score"], 8)
+
+    def test_string_scores_are_parsed(self):
+        self.assertEqual(validate_grade({"criteria": "c", "supporting_evidence": "e", "score": "7/10"})["Score"], 7)
+
+    def test_out_of_range_and_boolean_scores_are_rejected(self):
+        for score in (11, -1, "12", True, False, None, "high"):
+            with self.subTest(score=score), self.assertRaises(ValueError):
+                validate_grade({"criteria": "c", "supporting_evidence": "e", "score": score})
+
+    def test_missing_keys_and_non_objects_are_rejected(self):
+        for payload in ({"criteria": "c", "score": 5}, [1, 2], "7"):
+            with self.subTest(payload=payload), self.assertRaises(ValueError):
+                validate_grade(payload)
+
+    def test_invalid_json_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            parse_structured_response("Score: 7")
+
+
+if __name__ == "__main__":
+    unittest.main()
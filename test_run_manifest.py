@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from backends import MockBackend
+from evaluation import cached_completion, evaluate_metric, metric_fingerprint
+from response_cache import ResponseCache
+from run_manifest import DONE, FAILED, PENDING, RunManifest
+from scheduler import RequestScheduler
+from streaming import run_streaming_evaluation
+
+METRIC = {"name": "Relevance", "system_prompt": "Grade the relevance of the answer.", "columns": ["Question", "Answer"],
+          "model": "mock:judge"}
+
+
+def sheet(indexes: list) -> pd.DataFrame:
+    return pd.DataFrame([{"Index": index, "Question": f"Question {index}", "Context": "c", "Answer": f"Answer {index}",
+                          "Reference Context": "", "Reference Answer": ""} for index in indexes])
+
+
+class GarblingJudge:
+    """
+    MockBackend that answers its first replies to prompts containing marker with unparseable text.
+    """
+
+    def __init__(self, marker: str, garbled: int = 1):
+        self.marker = marker
+        self.garbled = garbled
+        self.calls = []
+        self.backend = MockBackend()
+
+    def create(self, model: str, messages: list, **params):
+        self.calls.append(messages[-1]["content"])
+        response = self.backend.create(model, messages, **params)
+        if self.marker in messages[-1]["content"] and self.garbled > 0:
+            self.garbled -= 1
+            response.choices[0].message.content = "I cannot grade this."
+        return response
+
+
+class RunManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.manifest = RunManifest(os.path.join(self.directory, "manifest.sqlite3"))
+        self.cache = ResponseCache(os.path.join(self.directory, "responses.sqlite3"))
+        self.addCleanup(self.manifest.connection.close)
+        self.addCleanup(self.cache.connection.close)
+
+    def evaluate(self, create, df: pd.DataFrame) -> list:
+        complete = cached_completion(RequestScheduler(create_fn=create), self.cache)
+        return evaluate_metric(df, METRIC, "metric", complete, manifest=self.manifest, run_key="run")
+
+
+class EvaluateMetricTests(RunManifestTestCase):
+    def test_restart_reuses_done_pairs(self):
+        judge = GarblingJudge("Question 2", garbled=0)
+        first = self.evaluate(judge.create, sheet([1, 2, 3]))
+        second = self.evaluate(judge.create, sheet([1, 2, 3]))
+        self.assertEqual(len(judge.calls), 3)
+        self.assertEqual([result["Score"] for result in first], [result["Score"] for result in second])
+        self.assertEqual(self.manifest.summary("run"), {PENDING: 0, DONE: 3, FAILED: 0})
+
+    def test_unparseable_reply_is_failed_and_regraded_without_the_cache(self):
+        judge = GarblingJudge("Question 2")
+        first = self.evaluate(judge.create, sheet([1, 2, 3]))
+        self.assertEqual(first[1]["Score"], "Not available")
+        self.assertEqual(self.manifest.summary("run"), {PENDING: 0, DONE: 2, FAILED: 1})
+
+        # The garbled reply is in the response cache; only a fresh request can replace it
+        second = self.evaluate(judge.create, sheet([1, 2, 3]))
+        self.assertEqual(len(judge.calls), 4)
+        self.assertIn("Question 2", judge.calls[-1])
+        self.assertIsInstance(second[1]["Score"], int)
+        self.assertEqual(self.manifest.summary("run"), {PENDING: 0, DONE: 3, FAILED: 0})
+
+    def test_request_errors_are_failed_and_retried(self):
+        calls = []
+
+        def create(model, messages, **params):
+            calls.append(model)
+            if len(calls) == 1:
+                raise ValueError("bad request")
+            return MockBackend().create(model, messages, **params)
+
+        first = self.evaluate(create, sheet([1]))
+        self.assertEqual(first[0]["Score"], "Error")
+        self.assertEqual(self.manifest.summary("run")[FAILED], 1)
+        self.evaluate(create, sheet([1]))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.manifest.summary("run")[DONE], 1)
+
+    def test_repeated_index_is_rejected(self):
+        judge = GarblingJudge("Question", garbled=0)
+        with self.assertRaisesRegex(ValueError, "unique Index"):
+            self.evaluate(judge.create, sheet([1, 2, 1]))
+        self.assertEqual(judge.calls, [])
+
+    def test_index_repeated_across_streaming_chunks_is_rejected(self):
+        path = os.path.join(self.directory, "sheet.csv")
+        sheet([1, 2, 3, 1]).to_csv(path, index=False)
+        judge = GarblingJudge("Question", garbled=0)
+        complete = cached_completion(RequestScheduler(create_fn=judge.create), self.cache)
+        with self.assertRaisesRegex(ValueError, "unique Index"):
+            run_streaming_evaluation(path, None, [METRIC], complete, os.path.join(self.directory, "journal.csv"),
+                                     "run", chunk_size=2, manifest=self.manifest)
+
+
+class ManifestResultsTests(RunManifestTestCase):
+    def test_results_follow_the_current_fingerprints(self):
+        result = {"Index": 1, "Metric": "Relevance", "Score": 7}
+        self.manifest.record("run", "1", result, "fpA")
+        self.assertEqual(self.manifest.results("run", {"Relevance": "fpA"}), [result])
+        self.assertEqual(self.manifest.results("run", {"Relevance": "fpB"}), [])
+        self.assertEqual(self.manifest.results("run", {"Faithfulness": "fpA"}), [])
+
+    def test_mark_pending_drops_the_stale_result(self):
+        self.manifest.record("run", "1", {"Index": 1, "Metric": "Relevance", "Score": 7}, "fpA")
+        self.manifest.mark_pending("run", ["1"], "Relevance", "fpB")
+        self.assertEqual(self.manifest.results("run", {"Relevance": "fpA"}), [])
+        self.assertEqual(self.manifest.results("run", {"Relevance": "fpB"}), [])
+
+    def test_failed_pair_stays_failed_while_pending(self):
+        self.manifest.record("run", "1", {"Index": 1, "Metric": "Relevance", "Score": "Error"}, "fp", "timeout")
+        self.manifest.mark_pending("run", ["1"], "Relevance", "fp")
+        self.assertEqual(self.manifest.failed_keys("run", "Relevance", "fp"), {"1"})
+        self.manifest.record("run", "1", {"Index": 1, "Metric": "Relevance", "Score": 7}, "fp")
+        self.assertEqual(self.manifest.failed_keys("run", "Relevance", "fp"), set())
+
+    def test_prompt_edit_regrades_every_row(self):
+        judge = GarblingJudge("Question", garbled=0)
+        self.evaluate(judge.create, sheet([1, 2]))
+        edited = {**METRIC, "system_prompt": "Grade the relevance strictly."}
+        complete = cached_completion(RequestScheduler(create_fn=judge.create), self.cache)
+        evaluate_metric(sheet([1, 2]), edited, "metric", complete, manifest=self.manifest, run_key="run")
+        self.assertEqual(len(judge.calls), 4)
+        current = self.manifest.results("run", {"Relevance": metric_fingerprint(edited, "metric")})
+        self.assertEqual(len(current), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
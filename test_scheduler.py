@@ -0,0 +1,117 @@
+import time
+import unittest
+
+import httpx
+import openai
+
+from backends import MockBackend, status_error
+from scheduler import MODEL_LIMITS, RateLimiter, RequestScheduler, configured_limits
+
+MESSAGES = [{"role": "system", "content": "You grade answers."}, {"role": "user", "content": "Grade this answer."}]
+
+
+def server_error() -> openai.InternalServerError:
+    request = httpx.Request("POST", "http://mock/chat/completions")
+    return status_error(httpx.Response(500, json={"error": "overloaded"}, request=request))
+
+
+class FlakyJudge:
+    """
+    MockBackend that fails its first failures requests with a retryable 500, each after the
+    backend's latency.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self.backend = MockBackend()
+
+    def create(self, model: str, messages: list, **params):
+        self.calls += 1
+        if self.calls <= self.failures:
+            time.sleep(self.backend.latency)
+            raise server_error()
+        return self.backend.create(model, messages, **params)
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_acquire_takes_a_request_and_the_tokens(self):
+        limiter = RateLimiter(rpm=60, tpm=6000)
+        limiter.acquire(1000)
+        self.assertAlmostEqual(limiter.requests.available, 59, delta=0.1)
+        self.assertAlmostEqual(limiter.tokens.available, 5000, delta=1)
+
+    def test_reconcile_returns_unused_headroom(self):
+        limiter = RateLimiter(rpm=60, tpm=6000)
+        limiter.acquire(1000)
+        limiter.reconcile(1000, 200)
+        self.assertAlmostEqual(limiter.tokens.available, 5800, delta=1)
+
+    def test_oversized_request_cannot_refund_more_than_it_took(self):
+        limiter = RateLimiter(rpm=60, tpm=600)
+        limiter.acquire(5000)  # Clamped to the whole bucket
+        limiter.reconcile(5000, 1500)
+        self.assertLess(limiter.tokens.available, -800)
+
+
+class RequestSchedulerTests(unittest.TestCase):
+    def test_failed_attempts_refund_their_reservation(self):
+        judge = FlakyJudge(failures=2)
+        scheduler = RequestScheduler(create_fn=judge.create, limits={"judge": {"rpm": 60, "tpm": 600}})
+        response = scheduler.create("judge", MESSAGES)
+
+        self.assertEqual(judge.calls, 3)
+        self.assertEqual(scheduler.retries, 2)
+        # Only the successful attempt is charged, and only for the tokens it used
+        limiter = scheduler.limiter_for("judge")
+        self.assertGreaterEqual(limiter.tokens.available, 600 - response.usage.total_tokens)
+
+    def test_timings_separate_the_call_from_the_wait_before_it(self):
+        judge = FlakyJudge(failures=1)
+        judge.backend.latency = 0.05
+        timings = {}
+        RequestScheduler(create_fn=judge.create, limits={"judge": {"rpm": 60, "tpm": 600}}).create(
+            "judge", MESSAGES, timings=timings)
+        self.assertGreaterEqual(timings["call_seconds"], 0.05)
+        self.assertGreaterEqual(timings["queue_seconds"], 0.05)  # The failed attempt ran before the last call
+
+    def test_non_transient_errors_are_not_retried(self):
+        calls = []
+
+        def create(model, messages, **params):
+            calls.append(model)
+            raise ValueError("bad request")
+
+        scheduler = RequestScheduler(create_fn=create, limits={"judge": {"rpm": 60, "tpm": 6000}})
+        with self.assertRaises(ValueError):
+            scheduler.create("judge", MESSAGES)
+        self.assertEqual(len(calls), 1)
+        self.assertGreaterEqual(scheduler.limiter_for("judge").tokens.available, 6000 - 1)
+
+    def test_rate_limit_waits_for_headroom(self):
+        scheduler = RequestScheduler(backend=MockBackend(), limits={"mock": {"rpm": 600, "tpm": 10_000_000}})
+        scheduler.limiter_for("mock").requests.available = 0
+        started = time.perf_counter()
+        scheduler.create("mock", MESSAGES)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.09)
+
+
+class LimitsTests(unittest.TestCase):
+    def test_gpt_4o_has_its_own_limits(self):
+        self.assertIn("gpt-4o", MODEL_LIMITS)
+        limiter = RequestScheduler().limiter_for("gpt-4o")
+        self.assertEqual(limiter.tokens.capacity, MODEL_LIMITS["gpt-4o"]["tpm"])
+
+    def test_configured_limits_override_one_field(self):
+        limits = configured_limits({"RATE_LIMITS": '{"gpt-4o": {"tpm": 800000}}'})
+        limiter = RequestScheduler(limits=limits).limiter_for("gpt-4o")
+        self.assertEqual(limiter.tokens.capacity, 800_000)
+        self.assertEqual(limiter.requests.capacity, MODEL_LIMITS["gpt-4o"]["rpm"])
+
+    def test_configured_limits_accept_a_parsed_table(self):
+        self.assertEqual(configured_limits({"RATE_LIMITS": {"gpt-4": {"rpm": 10}}}), {"gpt-4": {"rpm": 10}})
+        self.assertEqual(configured_limits({}), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
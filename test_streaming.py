@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from backends import MockBackend
+from evaluation import RESULT_COLUMNS, cached_completion
+from scheduler import RequestScheduler
+from streaming import ResultJournal, iter_sheet_chunks, run_streaming_evaluation
+
+COLUMNS = ["Index", "Metric", "Score"]
+METRIC = {"name": "Relevance", "system_prompt": "Grade the relevance of the answer.", "columns": ["Question", "Answer"],
+          "model": "mock:judge"}
+
+
+def results(indexes: list) -> list:
+    return [{"Index": index, "Metric": "Relevance", "Score": index % 11} for index in indexes]
+
+
+class StreamingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "results.partial.csv")
+
+
+class ResultJournalTests(StreamingTestCase):
+    def test_resume_truncates_an_uncommitted_chunk(self):
+        journal = ResultJournal(self.path, "run", COLUMNS, chunk_size=2)
+        journal.commit(results([1, 2]), 2)
+        # A crash while the second chunk was being written leaves part of it behind
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write("3,Relevance,3\n4,Rel")
+
+        resumed = ResultJournal(self.path, "run", COLUMNS, chunk_size=2)
+        self.assertEqual(resumed.committed_chunks, 1)
+        resumed.commit(results([3, 4]), 2)
+        self.assertEqual(pd.read_csv(self.path)["Index"].tolist(), [1, 2, 3, 4])
+        self.assertEqual(resumed.progress["results"], 4)
+
+    def test_a_different_run_starts_over(self):
+        ResultJournal(self.path, "run", COLUMNS).commit(results([1, 2]), 2)
+        journal = ResultJournal(self.path, "other run", COLUMNS)
+        self.assertEqual(journal.committed_chunks, 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_discard_removes_the_journal_and_progress(self):
+        journal = ResultJournal(self.path, "run", COLUMNS)
+        journal.commit(results([1]), 1)
+        journal.discard()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(journal.progress_path))
+
+
+class StreamingEvaluationTests(StreamingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sheet = os.path.join(self.directory, "sheet.csv")
+        pd.DataFrame([{"Index": index, "Question": f"Question {index}", "Context": "c", "Answer": f"Answer {index}",
+                       "Reference Context": "", "Reference Answer": ""} for index in range(5)]).to_csv(self.sheet,
+                                                                                                     index=False)
+        self.calls = []
+        backend = MockBackend()
+
+        def create(model, messages, **params):
+            self.calls.append(messages[-1]["content"])
+            return backend.create(model, messages, **params)
+
+        self.complete = cached_completion(RequestScheduler(create_fn=create))
+
+    def run_sheet(self):
+        return run_streaming_evaluation(self.sheet, None, [METRIC], self.complete, self.path, "run", chunk_size=2)
+
+    def test_resume_skips_committed_chunks(self):
+        self.run_sheet()
+        self.assertEqual(len(self.calls), 5)
+        # Simulate a crash after the first chunk: roll the progress back and leave a torn row behind
+        first_chunk = pd.read_csv(self.path).head(2)
+        journal = ResultJournal(self.path, "run", RESULT_COLUMNS["metric"], chunk_size=2)
+        journal.discard()
+        journal = ResultJournal(self.path, "run", RESULT_COLUMNS["metric"], chunk_size=2)
+        journal.commit(first_chunk.to_dict("records"), 2)
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write("2,Relevance")
+
+        progress = self.run_sheet()
+        self.assertEqual(len(self.calls), 8)  # Only the three rows after the committed chunk
+        self.assertEqual(progress["rows"], 5)
+        self.assertEqual(pd.read_csv(self.path)["Index"].tolist(), [0, 1, 2, 3, 4])
+
+    def test_empty_xlsx_cells_read_like_the_interactive_loader(self):
+        path = os.path.join(self.directory, "sheet.xlsx")
+        frame = pd.DataFrame({"Index": [1, 2], "Question": ["q", None], "Answer": [None, "a"]})
+        frame.to_excel(path, index=False)
+        streamed = pd.concat(iter_sheet_chunks(path, chunk_size=1), ignore_index=True)
+        pd.testing.assert_frame_equal(streamed, pd.read_excel(path))
+
+
+if __name__ == "__main__":
+    unittest.main()